@@ -15,15 +15,23 @@ For the full license text, please see:
 https://github.com/fishaudio/fish-speech/blob/main/LICENSE
 """
 
+import asyncio
 import base64
+import hashlib
 import io
 import json
+import math
+import os
 import queue
 import random
 import sys
+import threading
+import time
 import traceback
 import wave
 from argparse import ArgumentParser
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
 from http import HTTPStatus
 from pathlib import Path
 from typing import Annotated, Any, Literal, Optional
@@ -152,6 +160,118 @@ def encode_reference(*, decoder_model, reference_audio, enable_reference_audio):
     return prompt_tokens
 
 
+class ReferenceCache:
+    """
+    LRU of encoded reference prompts (tokens and text), bounded by bytes.
+    Saves a VQ encoder pass for every request reusing a reference voice.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(tokens, text):
+        return tokens.numel() * tokens.element_size() + len(text or "")
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, tokens, text: Optional[str] = None):
+        size = self._size(tokens, text)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._size(*self._entries.pop(key))
+            self._entries[key] = (tokens, text)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= self._size(*evicted)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def load_reference_file(audio_path: Path, text_path: Path):
+    """
+    Prompt tokens and text of a stored reference voice, encoded once per
+    version of its files. With --persist-reference-tokens the tokens are also
+    saved as .npy next to the audio and reused across restarts.
+    """
+    audio_stat, text_stat = audio_path.stat(), text_path.stat()
+    key = (
+        f"file:{audio_path}:{audio_stat.st_mtime_ns}:{audio_stat.st_size}:"
+        f"{text_path}:{text_stat.st_mtime_ns}"
+    )
+    cached = reference_cache.get(key)
+    if cached is not None:
+        return cached
+
+    tokens = None
+    npy_path = audio_path.with_suffix(".npy")
+    if (
+        args.persist_reference_tokens
+        and npy_path.exists()
+        and npy_path.stat().st_mtime_ns >= audio_stat.st_mtime_ns
+    ):
+        tokens = torch.from_numpy(np.load(npy_path)).to(decoder_model.device)
+        logger.info(f"Loaded prompt tokens from {npy_path}")
+
+    if tokens is None:
+        tokens = encode_reference(
+            decoder_model=decoder_model,
+            reference_audio=audio_to_bytes(str(audio_path)),
+            enable_reference_audio=True,
+        )
+        if args.persist_reference_tokens:
+            # Write then rename so concurrent workers never read a partial file
+            tmp_path = npy_path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, "wb") as f:
+                np.save(f, tokens.cpu().numpy())
+            os.replace(tmp_path, npy_path)
+
+    text = read_ref_text(str(text_path))
+    reference_cache.put(key, tokens, text)
+    return tokens, text
+
+
+def load_reference_bytes(audio: bytes):
+    """Prompt tokens of inline reference audio, cached by content hash"""
+    key = "sha256:" + hashlib.sha256(audio).hexdigest()
+    cached = reference_cache.get(key)
+    if cached is not None:
+        return cached[0]
+
+    tokens = encode_reference(
+        decoder_model=decoder_model,
+        reference_audio=audio,
+        enable_reference_audio=True,
+    )
+    reference_cache.put(key, tokens)
+    return tokens
+
+
 def decode_vq_tokens(
     *,
     decoder_model,
@@ -170,9 +290,223 @@ def decode_vq_tokens(
     raise ValueError(f"Unknown model type: {type(decoder_model)}")
 
 
+@torch.inference_mode()
+def decode_segment(codes):
+    """Decode one segment to float CPU audio, on the decode worker"""
+    with autocast_exclude_mps(
+        device_type=decoder_model.device.type, dtype=args.precision
+    ):
+        audio = decode_vq_tokens(decoder_model=decoder_model, codes=codes)
+    return audio.float().cpu()
+
+
+async def decode_vq_tokens_async(codes):
+    """
+    Decode `codes` to a float numpy waveform on the decoder batcher thread
+    (or the dedicated decode worker) while the event loop keeps running
+    """
+    if decoder_batcher is not None:
+        # Batched with the segments of concurrent requests
+        audio = await asyncio.wrap_future(decoder_batcher.submit(codes))
+    else:
+        audio = await asyncio.get_running_loop().run_in_executor(
+            decode_executor, decode_segment, codes
+        )
+    return audio.numpy()
+
+
+class DecoderBatcher:
+    """
+    Batches VQ-GAN decodes across concurrent requests. Code segments
+    submitted within `max_wait_ms` of each other are grouped by length and
+    each group is decoded in a single `decoder_model.decode` call on a
+    dedicated thread; each caller gets back the audio of its own segment.
+
+    Segments are never padded: the decoder applies the `feature_lengths`
+    mask only after the quantizer decode, so padding would bleed into the
+    end of shorter segments. Windowed streaming decode produces equal-length
+    windows, which is where batching pays off.
+    """
+
+    def __init__(self, decoder_model, max_batch_size=8, max_wait_ms=5.0):
+        self.decoder_model = decoder_model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="decoder-batcher", daemon=True
+        )
+
+        self.num_batches = 0
+        self.num_items = 0
+        self.batch_size_hist = Counter()
+
+    def start(self):
+        self._thread.start()
+
+    def submit(self, codes) -> Future:
+        """Queue `codes` [num_codebooks, T]; the future resolves to 1-D float CPU audio"""
+        future = Future()
+        self._queue.put((codes, future))
+        return future
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            try:
+                batch.append(
+                    self._queue.get(timeout=remaining)
+                    if remaining > 0
+                    else self._queue.get_nowait()
+                )
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            # Callers that went away (e.g. a disconnected stream) cancel their
+            # futures; drop them instead of decoding for nobody
+            batch = [
+                (codes, future)
+                for codes, future in self._collect()
+                if future.set_running_or_notify_cancel()
+            ]
+            groups = {}
+            for codes, future in batch:
+                groups.setdefault(tuple(codes.shape), []).append((codes, future))
+            for group in groups.values():
+                self._run_group(group)
+
+    def _run_group(self, group):
+        try:
+            audios = self._decode_batch([codes for codes, _ in group])
+        except Exception as e:
+            logger.exception(f"Batched decode of {len(group)} segments failed")
+            for _, future in group:
+                self._resolve(future.set_exception, e)
+            return
+        for (_, future), audio in zip(group, audios):
+            self._resolve(future.set_result, audio)
+
+    @staticmethod
+    def _resolve(setter, value):
+        # A future can still be resolved elsewhere; that must not kill the thread
+        try:
+            setter(value)
+        except InvalidStateError:
+            pass
+
+    @torch.inference_mode()
+    def _decode_batch(self, codes_list):
+        """Decode segments of equal shape [num_codebooks, T] as one batch"""
+        model = self.decoder_model
+        indices = torch.stack(codes_list).to(model.device)
+        feature_lengths = torch.full(
+            (len(codes_list),), indices.shape[2], device=model.device
+        )
+
+        with autocast_exclude_mps(device_type=model.device.type, dtype=args.precision):
+            audios, audio_lengths = model.decode(
+                indices=indices, feature_lengths=feature_lengths
+            )
+
+        self.num_batches += 1
+        self.num_items += len(codes_list)
+        self.batch_size_hist[len(codes_list)] += 1
+        audios = audios.float().cpu()
+        return [
+            audio[0, :n] for audio, n in zip(audios, audio_lengths.tolist())
+        ]
+
+    def stats(self):
+        mean_batch_size = self.num_items / self.num_batches if self.num_batches else 0.0
+        return {
+            "max_batch_size": self.max_batch_size,
+            "queue_depth": self._queue.qsize(),
+            "num_batches": self.num_batches,
+            "num_items": self.num_items,
+            "batch_size_hist": dict(sorted(self.batch_size_hist.items())),
+            "mean_batch_size": mean_batch_size,
+            "occupancy": mean_batch_size / self.max_batch_size,
+        }
+
+
+def samples_per_code(decoder_model):
+    # Each code covers `downsample_factor` mel frames of `hop_length` samples
+    return (
+        math.prod(decoder_model.quantizer.downsample_factor)
+        * decoder_model.spec_transform.hop_length
+    )
+
+
+async def decode_vq_tokens_windowed(
+    codes,
+    *,
+    window,
+    context,
+    crossfade,
+):
+    """
+    Decode `codes` [num_codebooks, T] in windows of `window` codes, yielding
+    float audio as soon as each window is decoded instead of after the whole
+    segment. Every window is decoded with `context` extra codes on both sides
+    so its edges match a full decode; `crossfade` samples past its end are
+    blended with the start of the next window to hide any remaining seam.
+    The next window is decoded while the current one is being sent.
+    """
+    spc = samples_per_code(decoder_model)
+    n_codes = codes.shape[1]
+    crossfade = min(crossfade, context * spc, window * spc)
+    spans = [
+        (start, min(start + window, n_codes), max(0, start - context))
+        for start in range(0, n_codes, window)
+    ]
+    if not spans:
+        return
+
+    def schedule(start, end, lo):
+        hi = min(n_codes, end + context)
+        return asyncio.ensure_future(decode_vq_tokens_async(codes[:, lo:hi]))
+
+    tail = None
+    pending = schedule(*spans[0])
+    try:
+        for i, (start, end, lo) in enumerate(spans):
+            audio = await pending
+            pending = schedule(*spans[i + 1]) if i + 1 < len(spans) else None
+
+            # This window's own samples, plus the crossfade region after it,
+            # which is shorter when the right context runs into the segment end
+            hi = min(n_codes, end + context)
+            overlap = min(crossfade, (hi - end) * spc)
+            chunk = audio[(start - lo) * spc : (end - lo) * spc + overlap]
+            if tail is not None:
+                fade_in = np.linspace(0.0, 1.0, len(tail), dtype=np.float32)
+                chunk[: len(tail)] = tail * (1.0 - fade_in) + chunk[: len(tail)] * fade_in
+            if overlap:
+                tail = chunk[-overlap:].copy()
+                chunk = chunk[:-overlap]
+            yield chunk
+    finally:
+        if pending is not None:
+            pending.cancel()
+
+
 routes = MultimethodRoutes(base_class=HttpView)
 
 
+class TTSRequest(ServeTTSRequest):
+    # Adds the formats served by the streaming encoders below
+    format: Literal["wav", "pcm", "mp3", "flac", "opus"] = "wav"
+
+
+# Smallest chunk_length that ServeTTSRequest validates
+MIN_CHUNK_LENGTH = 100
+
+
 def get_content_type(audio_format):
     if audio_format == "wav":
         return "audio/wav"
@@ -180,51 +514,100 @@ def get_content_type(audio_format):
         return "audio/flac"
     elif audio_format == "mp3":
         return "audio/mpeg"
+    elif audio_format == "opus":
+        return "audio/ogg"
     else:
         return "application/octet-stream"
 
 
+# ffmpeg output options of the compressed formats; packets are flushed as
+# soon as they are encoded so clients can start playback early
+STREAM_ENCODERS = {
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "64k", "-f", "mp3"],
+    # Opus only supports 48 kHz and its integer fractions
+    "opus": ["-ar", "48000", "-c:a", "libopus", "-b:a", "32k", "-f", "ogg", "-page_duration", "100000"],
+    "flac": ["-c:a", "flac", "-f", "flac"],
+}
+
+
+async def encode_stream(pcm_chunks, audio_format, sample_rate):
+    """
+    Encode an async iterable of mono s16le PCM chunks to `audio_format` with
+    an ffmpeg process, yielding encoded bytes as they come out. PCM is written
+    to ffmpeg's stdin while its stdout is read, so encoding keeps pace with
+    generation and a slow client slows the pipeline down through the pipes.
+    """
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-hide_banner", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+        *STREAM_ENCODERS[audio_format], "-flush_packets", "1", "pipe:1",
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+
+    async def feed():
+        try:
+            async for chunk in pcm_chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        finally:
+            process.stdin.close()
+
+    feeder = asyncio.ensure_future(feed())
+    try:
+        while True:
+            data = await process.stdout.read(1 << 16)
+            if not data:
+                break
+            yield data
+        # Surface generation errors, then encoder failures
+        await feeder
+        if await process.wait() != 0:
+            raise RuntimeError(f"ffmpeg {audio_format} encoder exited with {process.returncode}")
+    finally:
+        feeder.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
 @torch.inference_mode()
-def inference(req: ServeTTSRequest):
+def prepare_request(req: ServeTTSRequest):
+    """Encode the reference prompts and build the Llama generation request"""
 
     idstr: str | None = req.reference_id
     if idstr is not None:
         ref_folder = Path("references") / idstr
         ref_folder.mkdir(parents=True, exist_ok=True)
-        ref_audios = ["references/ref.mp3"]
+        ref_audios = [Path("references/ref.mp3")]
         # ref_audios = list_files(
         #     ref_folder, AUDIO_EXTENSIONS, recursive=True, sort=False
         # )
-        prompt_tokens = [
-            encode_reference(
-                decoder_model=decoder_model,
-                reference_audio=audio_to_bytes(str(ref_audio)),
-                enable_reference_audio=True,
-            )
+        prompts = [
+            load_reference_file(ref_audio, Path("references/ref.txt"))
             for ref_audio in ref_audios
         ]
-        prompt_texts = [
-            read_ref_text(str("references/ref.txt"))
-            # for ref_audio in ref_audios
-        ]
+        prompt_tokens = [tokens for tokens, _ in prompts]
+        prompt_texts = [text for _, text in prompts]
 
     else:
         # Parse reference audio aka prompt
         refs = req.references
         if refs is None:
             refs = []
-        prompt_tokens = [
-            encode_reference(
-                decoder_model=decoder_model,
-                reference_audio=ref.audio,
-                enable_reference_audio=True,
-            )
-            for ref in refs
-        ]
+        prompt_tokens = [load_reference_bytes(ref.audio) for ref in refs]
         prompt_texts = [ref.text for ref in refs]
 
+    # Opt-in: streaming hands shorter text chunks to the generator, so the
+    # first segment's codes (and first audio) arrive sooner. The cap stays
+    # within the request model's validated range (>= 100)
+    chunk_length = req.chunk_length
+    if req.streaming and chunk_length > 0 and args.stream_chunk_length > 0:
+        chunk_length = min(chunk_length, max(args.stream_chunk_length, MIN_CHUNK_LENGTH))
+
     # LLAMA Inference
-    request = dict(
+    return dict(
         device=decoder_model.device,
         max_new_tokens=req.max_new_tokens,
         text=(
@@ -237,13 +620,50 @@ def inference(req: ServeTTSRequest):
         temperature=req.temperature,
         compile=args.compile,
         iterative_prompt=req.chunk_length > 0,
-        chunk_length=req.chunk_length,
+        chunk_length=chunk_length,
         max_length=4096,
         prompt_tokens=prompt_tokens,
         prompt_text=prompt_texts,
     )
 
-    response_queue = queue.Queue()
+
+class LoopResponseQueue:
+    """
+    Response queue for the Llama worker thread that hands each item to an
+    asyncio.Queue on the event loop, so waiting for results parks no thread.
+    The worker only calls `put`.
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.queue = asyncio.Queue()
+
+    def put(self, item):
+        try:
+            self.loop.call_soon_threadsafe(self.queue.put_nowait, item)
+        except RuntimeError:
+            # The loop is closed (server shutting down); nobody is waiting
+            pass
+
+    async def get(self):
+        return await self.queue.get()
+
+
+async def inference(req: ServeTTSRequest, windowed: bool = False):
+    """
+    Generate float audio chunks for `req` without blocking the event loop.
+
+    Reference encoding runs in a worker thread, Llama results arrive on the
+    event loop through a `LoopResponseQueue`, and decoding goes to the decoder batcher (or the decode
+    worker). As an async generator it only decodes as fast as the consumer
+    takes chunks, so a slow client holds back its own stream, not others.
+    With `windowed`, segments are decoded and yielded in small windows.
+    """
+    loop = asyncio.get_running_loop()
+    start_time = time.perf_counter()
+    request = await loop.run_in_executor(None, prepare_request, req)
+
+    response_queue = LoopResponseQueue(loop)
     llama_queue.put(
         GenerateRequest(
             request=request,
@@ -251,51 +671,84 @@ def inference(req: ServeTTSRequest):
         )
     )
 
-    if req.streaming:
-        yield wav_chunk_header()
-
-    segments = []
+    first_audio = True
     while True:
-        result: WrappedGenerateResponse = response_queue.get()
+        result: WrappedGenerateResponse = await response_queue.get()
         if result.status == "error":
             raise result.response
-            break
 
         result: GenerateResponse = result.response
         if result.action == "next":
             break
 
-        with autocast_exclude_mps(
-            device_type=decoder_model.device.type, dtype=args.precision
-        ):
-            fake_audios = decode_vq_tokens(
-                decoder_model=decoder_model,
-                codes=result.codes,
+        if windowed:
+            chunks = decode_vq_tokens_windowed(
+                result.codes,
+                window=args.stream_window_codes,
+                context=args.stream_context_codes,
+                crossfade=decoder_model.spec_transform.sample_rate
+                * args.stream_crossfade_ms
+                // 1000,
             )
+        else:
+            chunks = decode_segment_async(result.codes)
 
-        fake_audios = fake_audios.float().cpu().numpy()
+        async for chunk in chunks:
+            if first_audio:
+                first_audio = False
+                logger.info(
+                    f"Time to first audio: {(time.perf_counter() - start_time) * 1000:.0f} ms"
+                )
+            yield chunk
 
-        if req.streaming:
-            yield (fake_audios * 32768).astype(np.int16).tobytes()
-        else:
-            segments.append(fake_audios)
+    logger.info(f"Generated audio in {(time.perf_counter() - start_time) * 1000:.0f} ms")
 
-    if req.streaming:
+
+async def decode_segment_async(codes):
+    yield await decode_vq_tokens_async(codes)
+
+
+async def inference_pcm(req: ServeTTSRequest, windowed: bool = False):
+    async for chunk in inference(req, windowed=windowed):
+        yield (chunk * 32768).astype(np.int16).tobytes()
+
+
+async def inference_stream(req: ServeTTSRequest):
+    pcm_chunks = inference_pcm(req, windowed=args.stream_window_codes > 0)
+    if req.format in STREAM_ENCODERS:
+        async for data in encode_stream(
+            pcm_chunks, req.format, decoder_model.spec_transform.sample_rate
+        ):
+            yield data
         return
 
+    if req.format == "wav":
+        yield wav_chunk_header(sample_rate=decoder_model.spec_transform.sample_rate)
+    async for chunk in pcm_chunks:
+        yield chunk
+
+
+async def inference_full(req: ServeTTSRequest):
+    segments = [chunk async for chunk in inference(req)]
     if len(segments) == 0:
         raise HTTPException(
             HTTPStatus.INTERNAL_SERVER_ERROR,
             content="No audio generated, please check the input text.",
         )
-
-    fake_audios = np.concatenate(segments, axis=0)
-    yield fake_audios
+    return np.concatenate(segments, axis=0)
 
 
-async def inference_async(req: ServeTTSRequest):
-    for chunk in inference(req):
-        yield chunk
+def encode_audio_file(audio, audio_format):
+    if audio_format == "pcm":
+        return (audio * 32768).astype(np.int16).tobytes()
+    buffer = io.BytesIO()
+    sf.write(
+        buffer,
+        audio,
+        decoder_model.spec_transform.sample_rate,
+        format=audio_format,
+    )
+    return buffer.getvalue()
 
 
 async def buffer_to_async_generator(buffer):
@@ -304,7 +757,7 @@ async def buffer_to_async_generator(buffer):
 
 @routes.http.post("/v1/tts")
 async def api_invoke_model(
-    req: Annotated[ServeTTSRequest, Body(exclusive=True)],
+    req: Annotated[TTSRequest, Body(exclusive=True)],
 ):
     """
     Invoke model and generate audio
@@ -316,32 +769,44 @@ async def api_invoke_model(
             content=f"Text is too long, max length is {args.max_text_length}",
         )
 
-    if req.streaming and req.format != "wav":
-        raise HTTPException(
-            HTTPStatus.BAD_REQUEST,
-            content="Streaming only supports WAV format",
-        )
-
     if req.streaming:
         return StreamResponse(
-            iterable=inference_async(req),
+            iterable=inference_stream(req),
+            headers={
+                "Content-Disposition": f"attachment; filename=audio.{req.format}",
+            },
+            content_type=get_content_type(req.format),
+        )
+    elif req.format == "opus":
+        # Not written by soundfile; run the whole clip through the encoder
+        fake_audios = await inference_full(req)
+        pcm = (fake_audios * 32768).astype(np.int16).tobytes()
+        audio_file = b"".join(
+            [
+                data
+                async for data in encode_stream(
+                    buffer_to_async_generator(pcm),
+                    req.format,
+                    decoder_model.spec_transform.sample_rate,
+                )
+            ]
+        )
+        return StreamResponse(
+            iterable=buffer_to_async_generator(audio_file),
             headers={
                 "Content-Disposition": f"attachment; filename=audio.{req.format}",
             },
             content_type=get_content_type(req.format),
         )
     else:
-        fake_audios = next(inference(req))
-        buffer = io.BytesIO()
-        sf.write(
-            buffer,
-            fake_audios,
-            decoder_model.spec_transform.sample_rate,
-            format=req.format,
+        fake_audios = await inference_full(req)
+        # File encoding is CPU-bound; keep it off the event loop
+        audio_file = await asyncio.get_running_loop().run_in_executor(
+            None, encode_audio_file, fake_audios, req.format
         )
 
         return StreamResponse(
-            iterable=buffer_to_async_generator(buffer.getvalue()),
+            iterable=buffer_to_async_generator(audio_file),
             headers={
                 "Content-Disposition": f"attachment; filename=audio.{req.format}",
             },
@@ -349,6 +814,20 @@ async def api_invoke_model(
         )
 
 
+@routes.http.get("/v1/stats")
+async def api_stats():
+    """
+    Decoder batch occupancy and reference cache counters
+    """
+
+    return JSONResponse(
+        {
+            "decoder": decoder_batcher.stats() if decoder_batcher is not None else None,
+            "reference_cache": reference_cache.stats(),
+        }
+    )
+
+
 @routes.http.post("/v1/health")
 async def api_health():
     """
@@ -392,6 +871,20 @@ def parse_args():
     parser.add_argument("--max-text-length", type=int, default=0)
     parser.add_argument("--listen", type=str, default="0.0.0.0:22311")
     parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--reference-cache-mb", type=int, default=64)
+    parser.add_argument("--persist-reference-tokens", action="store_true")
+    # Opt-in text chunk length cap for streaming requests (at least 100, the
+    # smallest chunk_length a request may ask for); 0 keeps the request's
+    parser.add_argument("--stream-chunk-length", type=int, default=0)
+    # Opt-in windowed streaming decode, in codes (~21.5 per second); each
+    # window also decodes 2x context codes. 0 decodes whole segments
+    parser.add_argument("--stream-window-codes", type=int, default=0)
+    parser.add_argument("--stream-context-codes", type=int, default=8)
+    parser.add_argument("--stream-crossfade-ms", type=int, default=20)
+    # Equal-length segments (e.g. streaming windows) from concurrent requests
+    # decoded together; 1 disables batching
+    parser.add_argument("--decode-batch-size", type=int, default=8)
+    parser.add_argument("--decode-max-wait-ms", type=float, default=5.0)
 
     return parser.parse_args()
 
@@ -421,6 +914,7 @@ class MsgPackRequest(HttpRequest):
     
 args = parse_args()
 args.precision = torch.half if args.half else torch.bfloat16
+reference_cache = ReferenceCache(max_bytes=args.reference_cache_mb << 20)
 
 logger.info("Loading Llama model...")
 llama_queue = launch_thread_safe_queue(
@@ -437,10 +931,22 @@ decoder_model = load_decoder_model(
         device=args.device,
     )
 
+# Single decode worker used when cross-request batching is off
+decode_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="decoder")
+decoder_batcher = None
+if args.decode_batch_size > 1:
+    decoder_batcher = DecoderBatcher(
+        decoder_model,
+        max_batch_size=args.decode_batch_size,
+        max_wait_ms=args.decode_max_wait_ms,
+    )
+    decoder_batcher.start()
+
 logger.info("VQ-GAN model loaded, warming up...")
-def warmup(app: Kui):
-    list(
-        inference(
+async def warmup(app: Kui):
+    [
+        chunk
+        async for chunk in inference(
             ServeTTSRequest(
                 text="Hello world.",
                 references=[],
@@ -454,7 +960,7 @@ def warmup(app: Kui):
                 format="wav",
             )
         )
-    )
+    ]
 logger.info(f"Warming up done, starting server at http://{args.listen}")
 app = Kui(
     on_startup=[warmup],
@@ -1,154 +1,225 @@
 import os
+import numpy as np
 import torch
-import torchaudio
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect, Header
 
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 from transformers import WhisperModel, WhisperProcessor
 import uvicorn
-from utils import load_model, convert_ids_to_tokens
+from utils import (
+    ICHIGO_NAME, MODEL_SIZE, load_model, load_prepared_model, convert_ids_to_tokens, PREPARED_ENCODER_FILE,
+    encode_codes, decode_codes, encode_codes_rle, CODES_MEDIA_TYPE, RLE_MEDIA_TYPE)
+from batching import MicroBatcher, AdmissionController
+from audio import AudioFormat, AudioProcessor, sniff_format
+from cache import TokenCache
+from streaming import PcmRingBuffer
+from onnx_backend import ONNX_GRAPH_FILE, OnnxEncoderRunner
+from stub_backend import StubTokenizer
+from metrics import (
+    AUDIO_SECONDS, CONTENT_TYPE_LATEST, IN_FLIGHT, REQUESTS, observe_stage, render_metrics, stage)
 import logging
 import io
-from enum import Enum
-from typing import Tuple
-import tempfile
+import time
+import asyncio
+from typing import List, Optional
+import whisper
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-os.environ["CUDA_VISIBLE_DEVICES"] = "0"  # Use the first GPU
 app = FastAPI()
 
-ichigo_name = "homebrewltd/Ichigo-whisper-v0.1:merge-medium-vi-2d-2560c-dim64.pth"
-model_size = "merge-medium-vi-2d-2560c-dim64"
-device = "cuda" if torch.cuda.is_available() else "cpu"
-
-
-vq_model = load_model(ref=ichigo_name, size=model_size)
-vq_model.setup(device=device)
-vq_model.to(device)
-vq_model = torch.compile(vq_model)
-
-
-class AudioFormat(str, Enum):
-    WAV = "wav"    # Supported by both backends
-    MP3 = "mp3"    # Supported by ffmpeg
-    FLAC = "flac"  # Supported by both
-    AAC = "aac"    # Supported by ffmpeg
-    OGG = "ogg"    # Supported by ffmpeg
-    OPUS = "opus"  # Supported by ffmpeg
-    PCM = "pcm"    # Raw PCM data
-
-
-# Format to backend mapping
-FORMAT_BACKENDS = {
-    AudioFormat.WAV: ["soundfile", "ffmpeg"],
-    AudioFormat.MP3: ["ffmpeg"],
-    AudioFormat.FLAC: ["soundfile", "ffmpeg"],
-    AudioFormat.AAC: ["ffmpeg"],
-    AudioFormat.OGG: ["ffmpeg"],
-    AudioFormat.OPUS: ["ffmpeg"],
-    AudioFormat.PCM: ["soundfile"]
-}
-
-
-class AudioProcessor:
-    def __init__(self):
-        self.available_backends = torchaudio.list_audio_backends()
-        logger.info(f"Available backends: {self.available_backends}")
-
-        # Verify ffmpeg support
-        self.has_ffmpeg = "ffmpeg" in self.available_backends
-        if not self.has_ffmpeg:
-            logger.warning(
-                "FFMPEG backend not available. Some formats may not be supported")
-
-    def _get_best_backend(self, format: AudioFormat) -> str:
-        """Determine the best backend for the given format"""
-        supported_backends = FORMAT_BACKENDS[format]
-        for backend in supported_backends:
-            if backend in self.available_backends:
-                return backend
-        raise ValueError(f"No available backend supports format {format}")
-
-    async def load_audio(
-        self,
-        file_obj: bytes,
-        format: AudioFormat,
-        target_sr: int = 16000
-    ) -> Tuple[torch.Tensor, int]:
-        """
-        Load audio from bytes object with format handling
-
-        Args:
-            file_obj: Audio file bytes
-            format: Audio format enum
-            target_sr: Target sample rate (default: 16000)
-
-        Returns:
-            Tuple[torch.Tensor, int]: Audio tensor and sample rate
-        """
-        try:
-            # Get appropriate backend
-            backend = self._get_best_backend(format)
-            torchaudio.set_audio_backend(backend)
-            logger.info(f"Using {backend} backend for {format} format")
-
-            if format == AudioFormat.PCM:
-                # Handle raw PCM
-                wav = torch.frombuffer(file_obj, dtype=torch.int16)
-                wav = wav.float() / 32768.0  # Normalize to [-1, 1]
-                wav = wav.unsqueeze(0)  # Add channel dimension
-                sr = target_sr
+# Device of this worker: WHISPER_DEVICES lists devices assigned round-robin to
+# worker slots (see serve.py), e.g. "cuda:0,cuda:1" or "cpu"
+worker_index = int(os.getenv("WHISPER_WORKER_INDEX", "0"))
+devices = [d for d in os.getenv("WHISPER_DEVICES", "").split(",") if d]
+if devices:
+    device = devices[worker_index % len(devices)]
+else:
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+
+# Micro-batching window for /tokenize
+max_batch_size = int(os.getenv("WHISPER_MAX_BATCH_SIZE", "8"))
+max_wait_ms = float(os.getenv("WHISPER_MAX_WAIT_MS", "10"))
+
+# Long-form audio is split into 30s windows instead of being truncated
+long_form = os.getenv("WHISPER_LONG_FORM", "1") == "1"
+# Mel frames are 10ms each
+chunk_overlap_frames = int(os.getenv("WHISPER_CHUNK_OVERLAP_MS", "0")) // 10
+chunk_search_frames = int(os.getenv("WHISPER_CHUNK_SEARCH_MS", "0")) // 10
+max_encoder_batch = int(os.getenv("WHISPER_MAX_ENCODER_BATCH", "32"))
+max_audio_seconds = float(os.getenv("WHISPER_MAX_AUDIO_SECONDS", "600"))
+max_batch_files = int(os.getenv("WHISPER_MAX_BATCH_FILES", "64"))
+# Shortest clip (16 kHz samples) the log-mel front-end can reflect-pad
+min_audio_samples = whisper.audio.N_FFT // 2 + 1
+# Run the encoder on a context rounded up to this bucket instead of 30s (0 = off)
+bucket_frames = int(os.getenv("WHISPER_BUCKET_MS", "0")) // 10 or None
+
+# Resample in the batched front-end on the model device instead of in the
+# decode threads (default on for GPUs)
+device_resample = os.getenv(
+    "WHISPER_DEVICE_RESAMPLE", "1" if device.startswith("cuda") else "0") == "1"
+
+# Token cache: in-process LRU bound in MB, plus an optional on-disk tier
+cache_mb = int(os.getenv("WHISPER_CACHE_MB", "64"))
+cache_dir = os.getenv("WHISPER_CACHE_DIR") or None
+
+# Executors keeping decode and inference off the event loop
+decode_workers = int(os.getenv("WHISPER_DECODE_WORKERS", "4"))
+# Requests admitted at once (decoding or waiting for the model) before 503
+max_in_flight = int(os.getenv("WHISPER_MAX_IN_FLIGHT", "64"))
+# Windows of one stream being tokenized at once; reading pauses at the limit
+max_stream_pending = max(1, int(os.getenv("WHISPER_STREAM_MAX_PENDING", "2")))
+
+# Start-up: prepared artifacts from prepare.py, encoder compilation and warmup
+prepared_dir = os.getenv("WHISPER_PREPARED_DIR") or None
+compile_encoder = os.getenv("WHISPER_COMPILE", "1") == "1"
+# Encoder precision: fp32, bf16 (autocast) or int8 (dynamic quantization, CPU)
+precision = os.getenv("WHISPER_PRECISION", "fp32")
+# Encoder + quantizer backend: torch, onnx to serve an export_onnx.py graph
+# with ONNX Runtime (WHISPER_ONNX_PATH, default tokenizer.onnx in the prepared
+# dir), or stub for weight-free load tests (see loadtest.py)
+backend = os.getenv("WHISPER_BACKEND", "torch")
+onnx_path = os.getenv("WHISPER_ONNX_PATH") or (
+    os.path.join(prepared_dir, ONNX_GRAPH_FILE) if prepared_dir else None)
+warmup_batch_sizes = [
+    int(b) for b in os.getenv("WHISPER_WARMUP_BATCH_SIZES", f"1,{max_batch_size}").split(",") if b
+]
+
+vq_model = None
+
+
+@contextmanager
+def timed_phase(name: str, timings: dict):
+    start = time.perf_counter()
+    yield
+    timings[name] = time.perf_counter() - start
+    logger.info(f"Startup phase '{name}' took {timings[name]:.2f}s")
+
+
+def warmup_contexts():
+    """Encoder context lengths the service can produce"""
+    if not bucket_frames or backend == "onnx":
+        return [whisper.audio.N_FRAMES]
+    return sorted({
+        vq_model._context_frames(n, bucket_frames)
+        for n in range(1, whisper.audio.N_FRAMES + 1, bucket_frames)
+    })
+
+
+def load_vq_model():
+    """Load, compile and warm up the tokenizer before the server reports ready"""
+    global vq_model
+    if backend not in ("torch", "onnx", "stub"):
+        raise ValueError(f"Unknown WHISPER_BACKEND {backend}; expected torch, onnx or stub")
+    timings = {}
+    if backend == "stub":
+        with timed_phase("load stub", timings):
+            model = StubTokenizer()
+    else:
+        with timed_phase("load vq weights", timings):
+            if prepared_dir:
+                model = load_prepared_model(prepared_dir, size=MODEL_SIZE, device=device)
             else:
-                # For formats that might need ffmpeg processing
-                with tempfile.NamedTemporaryFile(suffix=f".{format}") as temp_file:
-                    # Write bytes to temporary file
-                    temp_file.write(file_obj)
-                    temp_file.flush()
-
-                    # Load audio
-                    wav, sr = torchaudio.load(temp_file.name)
-
-            # Convert to mono if stereo
-            if wav.shape[0] > 1:
-                wav = torch.mean(wav, dim=0, keepdim=True)
-
-            # Resample if needed
-            if sr != target_sr:
-                wav = torchaudio.functional.resample(wav, sr, target_sr)
-                sr = target_sr
-
-            return wav, sr
-
-        except Exception as e:
-            logger.error(f"Error loading audio: {e}")
-            raise HTTPException(
-                status_code=400,
-                detail=f"Error processing {format} audio: {str(e)}"
-            )
+                model = load_model(ref=ICHIGO_NAME, size=MODEL_SIZE)
+    if backend == "onnx":
+        if not onnx_path:
+            raise ValueError("WHISPER_BACKEND=onnx needs WHISPER_ONNX_PATH or WHISPER_PREPARED_DIR")
+        with timed_phase("load onnx graph", timings):
+            model.use_graph(OnnxEncoderRunner(onnx_path, device=device))
+    elif backend == "torch":
+        with timed_phase("load encoder", timings):
+            encoder_path = os.path.join(prepared_dir, PREPARED_ENCODER_FILE) if prepared_dir else None
+            model.setup(device=device, encoder_path=encoder_path)
+    with timed_phase("move to device", timings):
+        model.to(device)
+    if precision != "fp32" and backend == "torch":
+        with timed_phase(f"{precision} conversion", timings):
+            model.set_precision(precision)
+    # Dynamically quantized linear layers are left to eager mode
+    if compile_encoder and precision != "int8" and backend == "torch":
+        # whmodel is a plain list, so the encoder is compiled in place
+        with timed_phase("compile", timings):
+            model.whmodel[0] = torch.compile(model.whmodel[0])
+    vq_model = model
+
+    # Run every configured batch size / context once so compilation happens now
+    with timed_phase("warmup", timings), torch.no_grad():
+        n_mels = vq_model._n_mels()
+        for batch_size in warmup_batch_sizes:
+            for n_ctx in warmup_contexts():
+                vq_model._encode_padded(
+                    torch.full((batch_size, n_mels, n_ctx), -1.5, device=device))
+        tokenize_batch([(torch.zeros(1, 16000), 16000)])
+    logger.info(
+        f"Tokenizer ready in {sum(timings.values()):.2f}s: "
+        + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    )
+
+
+def tokenize_batch(items):
+    """Run one batched front-end + encoder + quantizer pass over queued (wav, sr) items"""
+    wavs, sample_rates = zip(*items)
+    start = time.perf_counter()
+    wavs = [wav.to(device) for wav in wavs]
+    transfer_seconds = time.perf_counter() - start
+
+    with stage("quantize"), torch.no_grad():
+        codes = vq_model.quantize_batch(
+            wavs,
+            sample_rates=list(sample_rates),
+            long_form=long_form,
+            overlap_frames=chunk_overlap_frames,
+            boundary_search_frames=chunk_search_frames,
+            max_forward_batch=max_encoder_batch,
+            bucket_frames=bucket_frames,
+        )
+        if device.startswith("cuda"):
+            # Kernels run asynchronously; count them here, not in the copy back
+            torch.cuda.synchronize(device)
 
-    def get_format_info(self) -> dict:
-        """Get information about supported formats"""
-        supported_formats = {}
-        for format in AudioFormat:
-            try:
-                backend = self._get_best_backend(format)
-                supported_formats[format] = {
-                    "supported": True,
-                    "backend": backend
-                }
-            except ValueError:
-                supported_formats[format] = {
-                    "supported": False,
-                    "backend": None
-                }
-        return supported_formats
+    start = time.perf_counter()
+    codes = [c.cpu() for c in codes]
+    observe_stage("device_transfer", transfer_seconds + time.perf_counter() - start)
+    return codes
 
 
 app = FastAPI()
-audio_processor = AudioProcessor()
+decode_executor = ThreadPoolExecutor(
+    max_workers=decode_workers, thread_name_prefix="decode")
+# A single inference thread owns the model; concurrency comes from batching
+inference_executor = ThreadPoolExecutor(
+    max_workers=1, thread_name_prefix="inference")
+audio_processor = AudioProcessor(executor=decode_executor)
+batcher = MicroBatcher(
+    tokenize_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+    executor=inference_executor)
+admission = AdmissionController(max_in_flight=max_in_flight)
+# Options that change the produced tokens are part of the cache namespace
+token_cache = TokenCache(
+    namespace=f"{ICHIGO_NAME}|{MODEL_SIZE}|long_form={long_form}|"
+              f"overlap={chunk_overlap_frames}|search={chunk_search_frames}|"
+              f"bucket={bucket_frames}|precision={precision}|backend={backend}|"
+              f"device_resample={device_resample}",
+    max_bytes=cache_mb << 20,
+    disk_dir=cache_dir,
+)
+
+
+@app.on_event("startup")
+async def startup():
+    load_vq_model()
+    await batcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_batcher():
+    await batcher.stop()
+    decode_executor.shutdown(wait=False)
+    inference_executor.shutdown(wait=False)
 
 
 @app.get("/supported_formats")
@@ -157,40 +228,340 @@ async def get_supported_formats():
     return audio_processor.get_format_info()
 
 
-@app.post("/tokenize/{format}")
-async def tokenize_audio(format: AudioFormat = "wav", file: UploadFile = File(...)):
+@app.get("/stats/batcher")
+async def get_batcher_stats():
+    """Queue depth and batch size histograms of the tokenize batcher"""
+    return {**batcher.stats(), "admission": admission.stats()}
+
+
+@app.get("/stats/cache")
+async def get_cache_stats():
+    """Hit/miss counters and size of the token cache"""
+    return token_cache.stats()
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: stage latencies, request counts, audio seconds"""
+    return Response(content=render_metrics(), media_type=CONTENT_TYPE_LATEST)
+
+
+async def tokenize_bytes(file_obj: bytes, format: AudioFormat) -> np.ndarray:
+    """Tokenize one upload through the token cache and the micro-batcher"""
+    # Identical uploads reuse the stored codes. Hashing the upload and the
+    # disk tier are blocking, so they run on the decode pool
+    loop = asyncio.get_running_loop()
+    cache_key = await loop.run_in_executor(
+        decode_executor, token_cache.key, file_obj, format.value)
+    cached = await loop.run_in_executor(decode_executor, token_cache.get, cache_key)
+    if cached is not None:
+        return decode_codes(cached)
+
+    # Load and process audio
+    with stage("load_audio"):
+        wav, sr = await audio_processor.load_audio(
+            file_obj, format, target_sr=None if device_resample else 16000)
+    if wav.shape[-1] > max_audio_seconds * sr:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Audio longer than {max_audio_seconds:.0f} seconds"
+        )
+    if -(-wav.shape[-1] * 16000 // sr) < min_audio_samples:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Audio shorter than {min_audio_samples} samples at 16 kHz"
+        )
+
+    AUDIO_SECONDS.inc(wav.shape[-1] / sr)
+
+    # Generate tokens, batched with concurrent requests
+    codes = (await batcher.submit((wav, sr))).numpy()
+    await loop.run_in_executor(
+        decode_executor, token_cache.put, cache_key, encode_codes(codes))
+    return codes
+
+
+def _backend_name(format: AudioFormat) -> str:
+    """Decode backend of `format`, or "none" when none is available (PCM without soundfile)"""
     try:
-        # Read file
-        file_obj = await file.read()
+        return audio_processor._get_best_backend(format)
+    except ValueError:
+        return "none"
+
+
+def _count_request(format: Optional[AudioFormat], status: int):
+    if format is None:
+        # Rejected before the upload was read and sniffed
+        REQUESTS.labels("unknown", "none", str(status)).inc()
+        return
+    REQUESTS.labels(format.value, _backend_name(format), str(status)).inc()
+
+
+def _raise_overloaded():
+    raise HTTPException(
+        status_code=503,
+        detail="Tokenizer is overloaded, retry later",
+        headers={"Retry-After": "1"}
+    )
+
 
-        # Load and process audio
-        wav, sr = await audio_processor.load_audio(file_obj, format)
+@app.post("/tokenize")
+async def tokenize_audio_sniffed(
+    file: UploadFile = File(...),
+    accept: Optional[str] = Header(None)
+):
+    """
+    Tokenize one upload whose format is detected from its leading bytes
+    (WAV, FLAC, Ogg/Opus, MP3, ADTS AAC; anything else is read as 16 kHz
+    s16le PCM). Responses are as for /tokenize/{format}.
+    """
+    return await tokenize_upload(file, None, accept)
 
-        # Ensure we're using CUDA if available
-        device = "cuda" if torch.cuda.is_available() else "cpu"
-        wav = wav.to(device)
 
-        # Generate tokens
-        with torch.no_grad():
-            codes = vq_model.quantize(wav.to(device))
-            codes = codes[0].cpu().tolist()
-        
-        result = convert_ids_to_tokens(codes)
+@app.post("/tokenize/{format}")
+async def tokenize_audio(
+    format: AudioFormat = "wav",
+    file: UploadFile = File(...),
+    accept: Optional[str] = Header(None)
+):
+    """
+    Tokenize one upload. The JSON response carries the formatted token
+    string; internal callers can instead ask for the codes as raw uint16
+    (Accept: application/octet-stream) or uint16 (id, run length) pairs
+    (Accept: application/x-ichigo-rle) and skip string formatting/parsing.
+    """
+    return await tokenize_upload(file, format, accept)
+
+
+async def tokenize_upload(file: UploadFile, format: Optional[AudioFormat], accept: Optional[str]):
+    """Tokenize one upload in `format`, or in the format sniffed from its bytes if None"""
+    status = 500
+    if not admission.try_acquire():
+        _count_request(format, 503)
+        _raise_overloaded()
+    IN_FLIGHT.inc()
+    try:
+        # Read file
+        with stage("upload_read"):
+            file_obj = await file.read()
+        format = format or sniff_format(file_obj)
+
+        codes = await tokenize_bytes(file_obj, format)
+
+        if accept and (CODES_MEDIA_TYPE in accept or RLE_MEDIA_TYPE in accept):
+            rle = RLE_MEDIA_TYPE in accept
+            status = 200
+            return Response(
+                content=encode_codes_rle(codes) if rle else encode_codes(codes),
+                media_type=RLE_MEDIA_TYPE if rle else CODES_MEDIA_TYPE,
+                headers={
+                    "X-Model-Name": "Ichigo-whisper-v0.1",
+                    "X-Sample-Rate": "16000",
+                    "X-Token-Count": str(len(codes)),
+                }
+            )
+
+        with stage("convert_ids_to_tokens"):
+            result = convert_ids_to_tokens(codes)
 
+        status = 200
         return JSONResponse(content={
             "model_name": "Ichigo-whisper-v0.1",
             "tokens": f'{result}',
             "format": format,
-            "sample_rate": sr,
-            "backend_used": audio_processor._get_best_backend(format)
+            "sample_rate": 16000,
+            "backend_used": _backend_name(format)
         })
 
+    except HTTPException as e:
+        status = e.status_code
+        raise
     except Exception as e:
         logger.error(f"Error processing request: {e}")
         raise HTTPException(
             status_code=500,
             detail=f"Error processing request: {str(e)}"
         )
+    finally:
+        admission.release()
+        IN_FLIGHT.dec()
+        _count_request(format, status)
+
+
+@app.post("/tokenize_batch")
+async def tokenize_audio_batch(
+    files: List[UploadFile] = File(...),
+    format: Optional[AudioFormat] = None
+):
+    """
+    Tokenize several uploads in one request. Each file's format comes from
+    its extension, or from its leading bytes if the extension is unknown,
+    unless `format` is given; a failing file reports an error without
+    failing the others.
+    """
+    # A batch larger than the admission bound could never be admitted
+    limit = min(max_batch_files, max_in_flight)
+    if len(files) > limit:
+        raise HTTPException(
+            status_code=413,
+            detail=f"At most {limit} files per batch request"
+        )
+    # Every file takes a slot, so batches count against the same bound
+    if not admission.try_acquire(len(files)):
+        _raise_overloaded()
+    IN_FLIGHT.inc(len(files))
+
+    async def tokenize_file(file: UploadFile) -> dict:
+        file_format = None
+        try:
+            with stage("upload_read"):
+                file_obj = await file.read()
+            file_format = format
+            if file_format is None:
+                extension = os.path.splitext(file.filename or "")[1].lstrip(".").lower()
+                try:
+                    file_format = AudioFormat(extension)
+                except ValueError:
+                    file_format = sniff_format(file_obj)
+            codes = await tokenize_bytes(file_obj, file_format)
+            with stage("convert_ids_to_tokens"):
+                tokens = convert_ids_to_tokens(codes)
+            _count_request(file_format, 200)
+            return {
+                "filename": file.filename,
+                "tokens": tokens,
+                "format": file_format
+            }
+        except HTTPException as e:
+            if file_format is not None:
+                _count_request(file_format, e.status_code)
+            return {"filename": file.filename, "error": e.detail}
+        except Exception as e:
+            logger.error(f"Error processing {file.filename}: {e}")
+            if file_format is not None:
+                _count_request(file_format, 500)
+            return {"filename": file.filename, "error": str(e)}
+
+    try:
+        results = await asyncio.gather(*(tokenize_file(file) for file in files))
+        return JSONResponse(content={
+            "model_name": "Ichigo-whisper-v0.1",
+            "sample_rate": 16000,
+            "results": results
+        })
+    finally:
+        admission.release(len(files))
+        IN_FLIGHT.dec(len(files))
+
+
+@app.websocket("/tokenize/stream")
+async def tokenize_stream(websocket: WebSocket, sample_rate: int = 16000, window_ms: int = 30000):
+    """
+    Tokenize live microphone audio as it arrives.
+
+    The client sends raw mono s16le PCM as binary messages and the text
+    message "end" after the last one. Each completed window is tokenized
+    immediately and answered with {"type": "partial", "index", "tokens"};
+    after "end" the remainder is flushed and {"type": "final", "tokens"}
+    carries the token string of the whole stream.
+
+    A stream holds one admission slot, so at most WHISPER_STREAM_MAX_PENDING
+    of its windows are tokenized at once and the socket is not read while
+    they are pending. Streams longer than WHISPER_MAX_AUDIO_SECONDS are
+    closed with code 1009.
+    """
+    await websocket.accept()
+    if not 8000 <= sample_rate <= 48000:
+        await websocket.close(code=1008, reason="sample_rate must be between 8000 and 48000")
+        return
+    if not admission.try_acquire():
+        await websocket.close(code=1013, reason="Tokenizer is overloaded, retry later")
+        return
+    IN_FLIGHT.inc()
+
+    # At most one encoder window, so every window is a single batch item
+    window_ms = max(100, min(window_ms, 30000))
+    buffer = PcmRingBuffer(sample_rate * window_ms // 1000)
+    windows = asyncio.Queue()
+    pending = asyncio.Semaphore(max_stream_pending)
+    max_stream_bytes = 2 * int(max_audio_seconds * sample_rate)
+    received_bytes = 0
+
+    async def tokenize_window(data: bytes):
+        AUDIO_SECONDS.inc(len(data) / 2 / sample_rate)
+        if device_resample:
+            return await batcher.submit((audio_processor.pcm_to_tensor(data), sample_rate))
+        # CPU resampling runs on the decode threads, off the event loop
+        wav = await asyncio.get_running_loop().run_in_executor(
+            decode_executor, audio_processor.decode_pcm, data, sample_rate)
+        return await batcher.submit((wav, 16000))
+
+    async def submit_window(data: bytes):
+        # Backpressure: wait for a free window slot before reading further
+        await pending.acquire()
+        task = asyncio.create_task(tokenize_window(data))
+        task.add_done_callback(lambda _: pending.release())
+        windows.put_nowait(task)
+
+    async def send_tokens():
+        codes = []
+        while True:
+            task = await windows.get()
+            if task is None:
+                break
+            window_codes = await task
+            codes.append(window_codes)
+            await websocket.send_json({
+                "type": "partial",
+                "index": len(codes) - 1,
+                "tokens": convert_ids_to_tokens(window_codes, with_markers=False),
+            })
+        all_codes = torch.cat(codes) if codes else torch.zeros(0, dtype=torch.long)
+        await websocket.send_json({"type": "final", "tokens": convert_ids_to_tokens(all_codes)})
+
+    sender = asyncio.create_task(send_tokens())
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes"):
+                received_bytes += len(message["bytes"])
+                if received_bytes > max_stream_bytes:
+                    await websocket.close(
+                        code=1009, reason=f"Audio longer than {max_audio_seconds:.0f} seconds")
+                    return
+                for window in buffer.write(message["bytes"]):
+                    await submit_window(window)
+            elif message.get("text") == "end":
+                break
+            if sender.done():
+                # Surface tokenization errors without waiting for "end"
+                await sender
+
+        tail = buffer.flush()
+        if tail:
+            # A short tail is padded with silence up to the front-end minimum
+            min_tail_bytes = 2 * -(-min_audio_samples * sample_rate // 16000)
+            tail = tail.ljust(min_tail_bytes, b"\0")
+            await submit_window(tail)
+        windows.put_nowait(None)
+        await sender
+        await websocket.close()
+
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Error processing stream: {e}")
+        await websocket.close(code=1011, reason=f"Error processing stream: {str(e)}"[:120])
+    finally:
+        sender.cancel()
+        while not windows.empty():
+            task = windows.get_nowait()
+            if task is not None:
+                task.cancel()
+        admission.release()
+        IN_FLIGHT.dec()
 
 if __name__ == "__main__":
     import uvicorn
@@ -202,4 +573,5 @@ if __name__ == "__main__":
     for format, info in format_info.items():
         logger.info(f"{format}: {info}")
 
-    uvicorn.run(app, host="0.0.0.0", port=3348)
+    # Single process; use serve.py for multiple workers
+    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("WHISPER_PORT", "3348")))
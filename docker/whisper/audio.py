@@ -0,0 +1,329 @@
+import asyncio
+import io
+import logging
+import struct
+from enum import Enum
+from typing import Optional, Tuple
+
+import torch
+import torchaudio
+from fastapi import HTTPException
+from frontend import check_sample_rate, resample
+
+logger = logging.getLogger(__name__)
+
+
+class AudioFormat(str, Enum):
+    WAV = "wav"    # Supported by both backends
+    MP3 = "mp3"    # Supported by ffmpeg
+    FLAC = "flac"  # Supported by both
+    AAC = "aac"    # Supported by ffmpeg
+    OGG = "ogg"    # Supported by ffmpeg
+    OPUS = "opus"  # Supported by ffmpeg
+    PCM = "pcm"    # Raw PCM data
+
+
+# Format to backend mapping
+FORMAT_BACKENDS = {
+    AudioFormat.WAV: ["soundfile", "ffmpeg"],
+    AudioFormat.MP3: ["ffmpeg"],
+    AudioFormat.FLAC: ["soundfile", "ffmpeg"],
+    AudioFormat.AAC: ["ffmpeg"],
+    AudioFormat.OGG: ["ffmpeg"],
+    AudioFormat.OPUS: ["ffmpeg"],
+    AudioFormat.PCM: ["soundfile"]
+}
+
+# Container (demuxer) name passed to the decoder for in-memory loading
+CONTAINER_FORMATS = {
+    AudioFormat.WAV: "wav",
+    AudioFormat.MP3: "mp3",
+    AudioFormat.FLAC: "flac",
+    AudioFormat.AAC: "aac",
+    AudioFormat.OGG: "ogg",
+    AudioFormat.OPUS: "ogg",
+    AudioFormat.PCM: None
+}
+
+
+# MPEG audio frame header tables, indexed by the header's version bits
+# (0 = MPEG 2.5, 2 = MPEG 2, 3 = MPEG 1; 1 is reserved)
+_MPEG_SAMPLE_RATES = {
+    0: (11025, 12000, 8000),
+    2: (22050, 24000, 16000),
+    3: (44100, 48000, 32000),
+}
+# Bitrates in kbps by (MPEG 1, layer bits); index 0 (free format) and 15 are invalid
+_MPEG_BITRATES = {
+    (True, 3): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+    (True, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+    (True, 1): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    (False, 3): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+    (False, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+    (False, 1): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+
+
+def _mpeg_frame(data: bytes, offset: int) -> Optional[Tuple[int, int]]:
+    """
+    (length, stream fields) of the MPEG audio frame whose header starts at
+    `offset`, or None if the header is invalid
+    """
+    if offset + 4 > len(data) or data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[offset + 1] >> 3) & 0x03
+    layer = (data[offset + 1] >> 1) & 0x03
+    bitrate_index = data[offset + 2] >> 4
+    rate_index = (data[offset + 2] >> 2) & 0x03
+    if version == 1 or layer == 0 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _MPEG_BITRATES[(version == 3, layer)][bitrate_index] * 1000
+    sample_rate = _MPEG_SAMPLE_RATES[version][rate_index]
+    padding = (data[offset + 2] >> 1) & 0x01
+    if layer == 3:
+        # Layer I counts 4-byte slots
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 1 and version != 3:
+        # Layer III of MPEG 2/2.5 has half as many samples per frame
+        length = 72 * bitrate // sample_rate + padding
+    else:
+        length = 144 * bitrate // sample_rate + padding
+    # Version, layer and sample rate are the same in every frame of a stream
+    return length, (data[offset + 1] & 0x1E) << 8 | data[offset + 2] & 0x0C
+
+
+def _adts_frame(data: bytes, offset: int) -> Optional[Tuple[int, int]]:
+    """
+    (length, stream fields) of the ADTS (AAC) frame whose header starts at
+    `offset`, or None if the header is invalid
+    """
+    if offset + 7 > len(data) or data[offset] != 0xFF or data[offset + 1] & 0xF6 != 0xF0:
+        return None
+    if (data[offset + 2] >> 2) & 0x0F > 12:
+        # Reserved or explicit sampling frequency index
+        return None
+    length = ((data[offset + 3] & 0x03) << 11) | (data[offset + 4] << 3) | (data[offset + 5] >> 5)
+    if length < 7:
+        return None
+    # MPEG version, profile and sample rate are the same in every frame
+    return length, (data[offset + 1] & 0x08) << 8 | data[offset + 2] & 0xFC
+
+
+def _has_frames(data: bytes, parse_frame) -> bool:
+    """
+    Whether `data` starts with a valid frame header followed by a matching one.
+    A sync word alone also matches s16le PCM starting with a negative sample,
+    so a clip longer than one frame must carry the next header of the same
+    stream where the first frame ends.
+    """
+    first = parse_frame(data, 0)
+    if first is None:
+        return False
+    length, fields = first
+    if len(data) < length + 7:
+        # A single frame must end where the data ends
+        return len(data) >= length
+    second = parse_frame(data, length)
+    return second is not None and second[1] == fields
+
+
+def sniff_format(data: bytes) -> AudioFormat:
+    """Detect the container from its magic bytes; anything unrecognized is raw PCM"""
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        return AudioFormat.WAV
+    if data[:4] == b"fLaC":
+        return AudioFormat.FLAC
+    if data[:4] == b"OggS":
+        # The first Ogg page carries the codec identification header
+        return AudioFormat.OPUS if data[28:36] == b"OpusHead" else AudioFormat.OGG
+    if data[:3] == b"ID3":
+        return AudioFormat.MP3
+    # Bare frame streams; ADTS (AAC) sets the MPEG layer bits to 00
+    if _has_frames(data, _adts_frame):
+        return AudioFormat.AAC
+    if _has_frames(data, _mpeg_frame):
+        return AudioFormat.MP3
+    return AudioFormat.PCM
+
+
+def parse_wav_s16(data: bytes) -> Optional[Tuple[torch.Tensor, int]]:
+    """
+    Wrap the samples of a 16-bit PCM WAV file without going through a decoder
+
+    Returns:
+        Optional[Tuple[torch.Tensor, int]]: [channels, T] float audio and its
+        sample rate, or None if the file is not plain 16-bit PCM
+    """
+    offset, fmt = 12, None
+    while offset + 8 <= len(data):
+        chunk_id, size = struct.unpack_from("<4sI", data, offset)
+        offset += 8
+        if chunk_id == b"fmt " and size >= 16:
+            fmt = struct.unpack_from("<HHIIHH", data, offset)
+        elif chunk_id == b"data":
+            break
+        # Chunks are padded to an even size
+        offset += size + (size & 1)
+    else:
+        return None
+    if fmt is None:
+        return None
+
+    # WAVE_FORMAT_EXTENSIBLE is taken as PCM when 16-bit; exotic subformats
+    # with 16-bit containers do not occur in practice
+    audio_format, channels, sample_rate, _, _, bits = fmt
+    if audio_format not in (1, 0xFFFE) or bits != 16 or channels < 1:
+        return None
+
+    # Streamed recordings may leave the data size unset; read to the end
+    available = len(data) - offset
+    size = available if size in (0, 0xFFFFFFFF) else min(size, available)
+    count = size // (2 * channels) * channels
+    if count == 0:
+        return torch.zeros(channels, 0), sample_rate
+    samples = torch.frombuffer(data, dtype=torch.int16, count=count, offset=offset)
+    wav = samples.view(-1, channels).t().float() / 32768.0
+    return wav, sample_rate
+
+
+class AudioProcessor:
+    def __init__(self, executor=None):
+        self.executor = executor
+        self.available_backends = torchaudio.list_audio_backends()
+        logger.info(f"Available backends: {self.available_backends}")
+
+        # Verify ffmpeg support
+        self.has_ffmpeg = "ffmpeg" in self.available_backends
+        if not self.has_ffmpeg:
+            logger.warning(
+                "FFMPEG backend not available. Some formats may not be supported")
+
+        # Decoder backend of each format, resolved once and passed to every
+        # torchaudio.load call instead of switching the process-global backend
+        self.format_backends = {
+            format: next((b for b in FORMAT_BACKENDS[format] if b in self.available_backends), None)
+            for format in AudioFormat
+        }
+        logger.info(f"Decoder backends: { {f.value: b for f, b in self.format_backends.items()} }")
+
+    def _get_best_backend(self, format: AudioFormat) -> str:
+        """Determine the best backend for the given format"""
+        backend = self.format_backends[format]
+        if backend is None:
+            raise ValueError(f"No available backend supports format {format}")
+        return backend
+
+    async def load_audio(
+        self,
+        file_obj: bytes,
+        format: AudioFormat,
+        target_sr: Optional[int] = 16000
+    ) -> Tuple[torch.Tensor, int]:
+        """
+        Decode and resample audio on the processor's executor so the event
+        loop keeps serving other requests. See `decode` for arguments.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, self.decode, file_obj, format, target_sr)
+
+    def decode(
+        self,
+        file_obj: bytes,
+        format: AudioFormat,
+        target_sr: Optional[int] = 16000
+    ) -> Tuple[torch.Tensor, int]:
+        """
+        Load audio from bytes object with format handling
+
+        Args:
+            file_obj: Audio file bytes
+            format: Audio format enum
+            target_sr: Target sample rate (default: 16000), None to keep
+                the source rate
+
+        Returns:
+            Tuple[torch.Tensor, int]: Audio tensor and sample rate
+        """
+        try:
+            parsed = parse_wav_s16(file_obj) if format == AudioFormat.WAV else None
+            if parsed is not None:
+                # 16-bit PCM WAV: samples are wrapped in place, no decoder
+                wav, sr = parsed
+            elif format == AudioFormat.PCM:
+                # Handle raw PCM
+                wav = self.pcm_to_tensor(file_obj)
+                sr = target_sr or 16000
+            else:
+                # Decode straight from the uploaded bytes, no temp file
+                wav, sr = torchaudio.load(
+                    io.BytesIO(file_obj),
+                    format=CONTAINER_FORMATS[format],
+                    backend=self._get_best_backend(format))
+
+            # Client-controlled header rates bound the resampling kernel size
+            check_sample_rate(sr)
+
+            # Convert to mono if stereo
+            if wav.shape[0] > 1:
+                wav = torch.mean(wav, dim=0, keepdim=True)
+
+            # Resample if needed, with a cached kernel; target_sr=None keeps
+            # the native rate for resampling later on the model device
+            if target_sr and sr != target_sr:
+                wav = resample(wav, sr, target_sr)
+                sr = target_sr
+
+            return wav, sr
+
+        except Exception as e:
+            logger.error(f"Error loading audio: {e}")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Error processing {format} audio: {str(e)}"
+            )
+
+    @staticmethod
+    def pcm_to_tensor(data: bytes) -> torch.Tensor:
+        """Convert raw mono s16le PCM bytes to a [1, T] float tensor"""
+        if not data:
+            return torch.zeros(1, 0)
+        wav = torch.frombuffer(data, dtype=torch.int16)
+        wav = wav.float() / 32768.0  # Normalize to [-1, 1]
+        return wav.unsqueeze(0)  # Add channel dimension
+
+    def decode_pcm(
+        self,
+        data: bytes,
+        sample_rate: int = 16000,
+        target_sr: int = 16000
+    ) -> torch.Tensor:
+        """
+        Convert a chunk of raw mono s16le PCM to a [1, T] tensor at `target_sr`
+
+        Args:
+            data: PCM bytes
+            sample_rate: Sample rate of the PCM data
+            target_sr: Target sample rate (default: 16000)
+        """
+        wav = self.pcm_to_tensor(data)
+        if wav.shape[-1]:
+            wav = resample(wav, sample_rate, target_sr)
+        return wav
+
+    def get_format_info(self) -> dict:
+        """Get information about supported formats"""
+        supported_formats = {}
+        for format in AudioFormat:
+            try:
+                backend = self._get_best_backend(format)
+                supported_formats[format] = {
+                    "supported": True,
+                    "backend": backend
+                }
+            except ValueError:
+                supported_formats[format] = {
+                    "supported": False,
+                    "backend": None
+                }
+        return supported_formats
@@ -0,0 +1,245 @@
+"""
+Offline batch tokenization of audio corpora.
+
+Audio is decoded in a process pool and fed to the tokenizer in large padded
+batches. Results go to sharded output:
+
+    OUT/shard-00000.npy   uint16 sound token ids of many files, concatenated
+    OUT/index.jsonl       {"path", "shard", "offset", "length", "duration"}
+
+A shard is listed in the index only after it has been written, so an
+interrupted run resumes by skipping the paths already in the index.
+
+Usage:
+    python batch_tokenize.py --input /data/audio --out /data/tokens
+    python batch_tokenize.py --manifest files.txt --out /data/tokens
+"""
+import argparse
+import itertools
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+import torch
+import torchaudio
+import whisper
+
+from frontend import check_sample_rate
+from utils import (
+    ICHIGO_NAME, MODEL_SIZE, PREPARED_ENCODER_FILE, load_model, load_prepared_model)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Shortest clip (16 kHz samples) the log-mel front-end can reflect-pad
+MIN_AUDIO_SAMPLES = whisper.audio.N_FFT // 2 + 1
+AUDIO_EXTENSIONS = {".wav", ".mp3", ".flac", ".aac", ".ogg", ".opus", ".m4a"}
+
+
+def list_audio_files(root: str) -> List[str]:
+    paths = []
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            if os.path.splitext(filename)[1].lower() in AUDIO_EXTENSIONS:
+                paths.append(os.path.join(dirpath, filename))
+    return sorted(paths)
+
+
+def read_manifest(manifest: str) -> List[str]:
+    """One path per line, or JSON lines with a "path" field; relative to the manifest"""
+    base = os.path.dirname(os.path.abspath(manifest))
+    paths = []
+    with open(manifest) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            path = json.loads(line)["path"] if line.startswith("{") else line
+            paths.append(os.path.join(base, path))
+    return paths
+
+
+def _init_worker():
+    # Decode workers each get one thread; parallelism comes from the pool
+    torch.set_num_threads(1)
+
+
+def decode_file(path: str) -> Tuple[str, Optional[np.ndarray], int, Optional[str]]:
+    """Decode to a mono float32 array at the file's own sample rate"""
+    try:
+        wav, sr = torchaudio.load(path)
+        check_sample_rate(sr)
+    except Exception as e:
+        return path, None, 0, str(e)
+    wav = wav.mean(dim=0) if wav.shape[0] > 1 else wav[0]
+    return path, wav.numpy(), sr, None
+
+
+def iter_decoded(paths: Iterable[str], workers: int, prefetch: int) -> Iterator[tuple]:
+    """Decode in a process pool, in order, with at most `prefetch` files in flight"""
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        paths = iter(paths)
+        pending = deque(pool.submit(decode_file, p) for p in itertools.islice(paths, prefetch))
+        while pending:
+            result = pending.popleft().result()
+            next_path = next(paths, None)
+            if next_path is not None:
+                pending.append(pool.submit(decode_file, next_path))
+            yield result
+
+
+class ShardWriter:
+    """Accumulates token arrays and writes them as npy shards plus an index"""
+
+    def __init__(self, out_dir: str, shard_size: int):
+        self.out_dir = out_dir
+        self.shard_size = shard_size
+        self.index_path = os.path.join(out_dir, "index.jsonl")
+        os.makedirs(out_dir, exist_ok=True)
+
+        self.done = set()
+        self.next_shard = 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                for line in f:
+                    entry = json.loads(line)
+                    self.done.add(entry["path"])
+                    shard_id = int(entry["shard"].split("-")[1].split(".")[0])
+                    self.next_shard = max(self.next_shard, shard_id + 1)
+
+        self._codes: List[np.ndarray] = []
+        self._entries: List[dict] = []
+        self._offset = 0
+
+    def add(self, path: str, codes: np.ndarray, duration: float):
+        self._entries.append({
+            "path": path,
+            "offset": self._offset,
+            "length": int(codes.size),
+            "duration": round(duration, 3),
+        })
+        self._codes.append(codes.astype(np.uint16))
+        self._offset += codes.size
+        if len(self._entries) >= self.shard_size:
+            self.flush()
+
+    def flush(self):
+        if not self._entries:
+            return
+        shard = f"shard-{self.next_shard:05d}.npy"
+        path = os.path.join(self.out_dir, shard)
+        # Write then rename, and only then index, so a crash never leaves
+        # index entries pointing at a partial shard
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, np.concatenate(self._codes))
+        os.replace(path + ".tmp", path)
+        with open(self.index_path, "a") as f:
+            for entry in self._entries:
+                f.write(json.dumps({**entry, "shard": shard}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.next_shard += 1
+        self._codes, self._entries, self._offset = [], [], 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--input", help="Directory searched recursively for audio files")
+    source.add_argument("--manifest", help="File listing audio paths")
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--ref", default=ICHIGO_NAME)
+    parser.add_argument("--size", default=MODEL_SIZE)
+    parser.add_argument("--prepared-dir", default=None)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--batch-size", type=int, default=32, help="Files per tokenizer call")
+    parser.add_argument("--max-forward-batch", type=int, default=64, help="30s windows per encoder forward")
+    parser.add_argument("--decode-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--shard-size", type=int, default=10000, help="Files per output shard")
+    parser.add_argument("--log-every", type=int, default=10, help="Batches between throughput reports")
+    args = parser.parse_args()
+
+    paths = list_audio_files(args.input) if args.input else read_manifest(args.manifest)
+    writer = ShardWriter(args.out, args.shard_size)
+    todo = [p for p in paths if p not in writer.done]
+    logger.info(f"{len(paths)} files, {len(paths) - len(todo)} already done, {len(todo)} to tokenize")
+
+    if args.prepared_dir:
+        vq_model = load_prepared_model(args.prepared_dir, size=args.size, device=args.device)
+        vq_model.setup(device=args.device, encoder_path=os.path.join(args.prepared_dir, PREPARED_ENCODER_FILE))
+    else:
+        vq_model = load_model(ref=args.ref, size=args.size)
+        vq_model.setup(device=args.device)
+    vq_model.to(args.device)
+
+    start = time.perf_counter()
+    num_files, num_failed, audio_seconds = 0, 0, 0.0
+
+    def run_batch(batch):
+        nonlocal num_files, num_failed, audio_seconds
+        try:
+            with torch.no_grad():
+                codes = vq_model.quantize_batch(
+                    [torch.from_numpy(wav) for _, wav, _ in batch],
+                    sample_rates=[sr for _, _, sr in batch],
+                    long_form=True,
+                    max_forward_batch=args.max_forward_batch,
+                )
+        except Exception as e:
+            if len(batch) == 1:
+                # Left out of the index, so a later run retries it
+                logger.warning(f"Skipping {batch[0][0]}: {e}")
+                num_failed += 1
+                return
+            # One bad file must not take the others down: retry one by one
+            logger.warning(f"Batch of {len(batch)} files failed ({e}), retrying file by file")
+            for item in batch:
+                run_batch([item])
+            return
+        for (path, wav, sr), c in zip(batch, codes):
+            writer.add(path, c.cpu().numpy(), wav.size / sr)
+            num_files += 1
+            audio_seconds += wav.size / sr
+
+    batch, num_batches = [], 0
+    decode_prefetch = max(args.batch_size * 2, args.decode_workers * 4)
+    for path, wav, sr, error in iter_decoded(todo, args.decode_workers, decode_prefetch):
+        if error is None and -(-wav.size * 16000 // sr) < MIN_AUDIO_SAMPLES:
+            error = f"shorter than {MIN_AUDIO_SAMPLES} samples at 16 kHz"
+        if error is not None:
+            # Left out of the index, so a later run retries it
+            logger.warning(f"Skipping {path}: {error}")
+            num_failed += 1
+            continue
+        batch.append((path, wav, sr))
+        if len(batch) < args.batch_size:
+            continue
+        run_batch(batch)
+        batch = []
+        num_batches += 1
+        if num_batches % args.log_every == 0:
+            elapsed = time.perf_counter() - start
+            logger.info(
+                f"{num_files}/{len(todo)} files, {num_files / elapsed:.1f} files/s, "
+                f"{audio_seconds / 3600 / elapsed:.3f} audio-hours/s"
+            )
+    if batch:
+        run_batch(batch)
+    writer.flush()
+
+    elapsed = time.perf_counter() - start
+    logger.info(
+        f"Done: {num_files} files ({num_failed} failed) in {elapsed:.1f}s, "
+        f"{num_files / max(elapsed, 1e-9):.1f} files/s, "
+        f"{audio_seconds / 3600 / max(elapsed, 1e-9):.3f} audio-hours/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
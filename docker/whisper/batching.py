@@ -0,0 +1,186 @@
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Dynamic micro-batching queue in front of a batched model call.
+
+    Requests submitted concurrently are gathered for at most ``max_wait_ms``
+    (or until ``max_batch_size`` items are pending) and handed to
+    ``batch_fn`` as one list. ``batch_fn`` must return one result per item,
+    in order.
+    """
+
+    def __init__(
+        self,
+        batch_fn: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 10.0,
+        executor=None,
+    ):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Histograms used to tune the window under load
+        self.batch_size_hist = Counter()
+        self.queue_depth_hist = Counter()
+        self.num_batches = 0
+        self.num_items = 0
+
+    async def start(self):
+        """Start the background batching loop on the running event loop"""
+        if self._task is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"Micro-batcher started (max_batch_size={self.max_batch_size}, "
+            f"max_wait_ms={self.max_wait * 1000:.1f})"
+        )
+
+    async def stop(self):
+        """Stop the batching loop and fail any requests still queued"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        while not self._queue.empty():
+            _, future = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Batcher stopped"))
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result"""
+        if self._task is None:
+            raise RuntimeError("Batcher is not running")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _collect(self) -> list:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            self.queue_depth_hist[_bucket(self._queue.qsize())] += 1
+
+            # Drop requests whose clients have already gone away
+            batch = [(item, future) for item, future in batch if not future.done()]
+            if not batch:
+                continue
+
+            self.batch_size_hist[len(batch)] += 1
+            self.num_batches += 1
+            self.num_items += len(batch)
+
+            try:
+                results = await loop.run_in_executor(
+                    self.executor, self.batch_fn, [item for item, _ in batch]
+                )
+            except Exception as e:
+                logger.error(f"Batch of {len(batch)} failed: {e}")
+                if len(batch) == 1:
+                    if not batch[0][1].done():
+                        batch[0][1].set_exception(e)
+                    continue
+                # Retry item by item so one bad input only fails its own request
+                await self._run_items(loop, batch)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def _run_items(self, loop, batch):
+        for item, future in batch:
+            try:
+                (result,) = await loop.run_in_executor(self.executor, self.batch_fn, [item])
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> dict:
+        """Queue depth and batch size histograms"""
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self.queue_depth,
+            "num_batches": self.num_batches,
+            "num_items": self.num_items,
+            "mean_batch_size": self.num_items / self.num_batches if self.num_batches else 0.0,
+            "batch_size_hist": dict(sorted(self.batch_size_hist.items())),
+            "queue_depth_hist": dict(sorted(self.queue_depth_hist.items())),
+        }
+
+
+def _bucket(depth: int) -> int:
+    """Power-of-two bucket (0, 1, 2, 4, 8, ...) for queue depth samples"""
+    if depth <= 0:
+        return 0
+    return 1 << (depth - 1).bit_length()
+
+
+class AdmissionController:
+    """
+    Bound the number of requests admitted at once.
+
+    Requests beyond ``max_in_flight`` are rejected up front so latency stays
+    bounded instead of growing with the backlog.
+    """
+
+    def __init__(self, max_in_flight: int = 64):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.num_rejected = 0
+
+    def try_acquire(self, n: int = 1) -> bool:
+        """Admit `n` items (e.g. the files of a batch request) all or none"""
+        if self.in_flight + n > self.max_in_flight:
+            self.num_rejected += 1
+            return False
+        self.in_flight += n
+        return True
+
+    def release(self, n: int = 1):
+        self.in_flight -= n
+
+    def stats(self) -> dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "num_rejected": self.num_rejected,
+        }
@@ -0,0 +1,72 @@
+"""
+Correctness and speed harness for the variable-length encoder path.
+
+For each bucket size, tokenizes clips of several lengths with the full 30s
+padded context and with the bucketed context, and reports token agreement,
+latency and estimated encoder FLOPs.
+
+Usage: python bench_buckets.py [--buckets-ms 1000 2500 5000 10000]
+"""
+import argparse
+
+import torch
+import whisper
+
+from audio import AudioFormat, AudioProcessor
+from utils import ICHIGO_NAME, MODEL_SIZE, load_model, timed
+
+
+def encoder_flops(encoder, n_frames: int) -> float:
+    """Approximate multiply-add FLOPs of one AudioEncoder forward"""
+    n_mels = encoder.conv1.in_channels
+    d = encoder.positional_embedding.shape[1]
+    t = n_frames // 2
+    conv = 2 * 3 * n_mels * d * n_frames + 2 * 3 * d * d * t
+    # qkv + out projections, 4x MLP, and the two attention matmuls
+    per_block = 2 * t * (4 * d * d + 8 * d * d) + 2 * 2 * t * t * d
+    return conv + len(encoder.blocks) * per_block
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--buckets-ms", type=int, nargs="+", default=[1000, 2500, 5000, 10000])
+    parser.add_argument("--clip-seconds", type=float, nargs="+", default=[2, 5, 10, 20])
+    parser.add_argument("--sample", default="samples/ref.mp3")
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    vq_model = load_model(ref=ICHIGO_NAME, size=MODEL_SIZE)
+    vq_model.setup(device=device)
+    vq_model.to(device)
+    encoder = vq_model.whmodel[0].encoder
+
+    with open(args.sample, "rb") as f:
+        wav, sr = AudioProcessor().decode(f.read(), AudioFormat.MP3)
+    # Repeat the sample so every requested length is covered
+    longest = int(max(args.clip_seconds) * sr)
+    wav = wav.repeat(1, -(-longest // wav.shape[-1]))
+
+    full_flops = encoder_flops(encoder, whisper.audio.N_FRAMES)
+    print(f"{'clip s':>7}{'bucket ms':>11}{'agree':>8}{'padded ms':>11}"
+          f"{'bucket ms':>11}{'speedup':>9}{'FLOPs':>8}")
+    for seconds in args.clip_seconds:
+        clip = wav[:, : int(seconds * sr)]
+        reference = vq_model.quantize(clip)[0]
+        padded_ms = timed(lambda: vq_model.quantize(clip), args.iterations, device)
+
+        for bucket_ms in args.buckets_ms:
+            bucket_frames = bucket_ms // 10
+            tokens = vq_model.quantize(clip, bucket_frames=bucket_frames)[0]
+            agree = (tokens == reference).float().mean().item()
+            bucket_ms_time = timed(
+                lambda: vq_model.quantize(clip, bucket_frames=bucket_frames),
+                args.iterations, device)
+            n_ctx = vq_model._context_frames(int(seconds * 100), bucket_frames)
+            flops = encoder_flops(encoder, n_ctx) / full_flops
+            print(f"{seconds:>7.1f}{bucket_ms:>11}{agree:>8.3f}{padded_ms:>11.1f}"
+                  f"{bucket_ms_time:>11.1f}{padded_ms / bucket_ms_time:>8.2f}x{flops:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
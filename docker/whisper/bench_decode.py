@@ -0,0 +1,65 @@
+"""
+Compare the legacy temp-file decode path with in-memory decoding.
+
+Usage: python bench_decode.py [--iterations 50]
+"""
+import argparse
+import io
+import tempfile
+
+import torch
+import torchaudio
+
+from audio import AudioFormat, AudioProcessor
+from utils import SAMPLES, timed
+
+
+def decode_tempfile(file_obj: bytes, format: AudioFormat, target_sr: int = 16000):
+    """The previous AudioProcessor.load_audio path: write, flush, re-read"""
+    with tempfile.NamedTemporaryFile(suffix=f".{format.value}") as temp_file:
+        temp_file.write(file_obj)
+        temp_file.flush()
+        wav, sr = torchaudio.load(temp_file.name)
+    if wav.shape[0] > 1:
+        wav = torch.mean(wav, dim=0, keepdim=True)
+    if sr != target_sr:
+        wav = torchaudio.functional.resample(wav, sr, target_sr)
+    return wav, target_sr
+
+
+def load_samples() -> dict:
+    samples = {}
+    for path, format in SAMPLES.items():
+        with open(path, "rb") as f:
+            samples[format] = f.read()
+
+    # No WAV is bundled, so derive one from the mp3 sample
+    wav, sr = torchaudio.load(io.BytesIO(samples[AudioFormat.MP3]), format="mp3")
+    buffer = io.BytesIO()
+    torchaudio.save(buffer, wav, sr, format="wav")
+    samples[AudioFormat.WAV] = buffer.getvalue()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    processor = AudioProcessor()
+    samples = load_samples()
+
+    print(f"{'format':<8}{'bytes':>10}{'tempfile ms':>14}{'in-memory ms':>14}{'speedup':>10}")
+    for format, data in samples.items():
+        old, _ = decode_tempfile(data, format)
+        new, _ = processor.decode(data, format)
+        if old.shape != new.shape:
+            print(f"warning: {format.value} shapes differ {tuple(old.shape)} vs {tuple(new.shape)}")
+
+        old_ms = timed(lambda: decode_tempfile(data, format), args.iterations)
+        new_ms = timed(lambda: processor.decode(data, format), args.iterations)
+        print(f"{format.value:<8}{len(data):>10}{old_ms:>14.2f}{new_ms:>14.2f}{old_ms / new_ms:>9.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Benchmark the batched resample + log-mel front-end against the per-clip path.
+
+For each source rate, a batch of random-length clips is processed either
+clip by clip (torchaudio.functional.resample, which rebuilds the sinc kernel
+each call, then whisper.log_mel_spectrogram) or with the cached-kernel
+batched front-end on the model device.
+
+Usage: python bench_frontend.py [--batch-size 8] [--device cuda]
+"""
+import argparse
+
+import torch
+import torchaudio
+import whisper
+
+from frontend import log_mel_spectrogram_batch, resample_batch
+from utils import timed
+
+SAMPLE_RATES = [8000, 22050, 44100, 48000]
+
+
+def per_clip(clips, sr, n_mels, device):
+    mels = []
+    for clip in clips:
+        wav = torchaudio.functional.resample(clip, sr, 16000).to(device)
+        mels.append(whisper.log_mel_spectrogram(wav, n_mels))
+    return mels
+
+
+def batched(clips, sr, n_mels, device):
+    wavs = resample_batch(clips, [sr] * len(clips), device)
+    return log_mel_spectrogram_batch(wavs, n_mels, device)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--min-seconds", type=float, default=2)
+    parser.add_argument("--max-seconds", type=float, default=15)
+    parser.add_argument("--n-mels", type=int, default=80)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args()
+
+    generator = torch.Generator().manual_seed(0)
+    print(f"{'rate':>7}{'per-clip ms':>13}{'batched ms':>12}{'speedup':>9}{'max |diff|':>12}")
+    for sr in SAMPLE_RATES:
+        seconds = torch.empty(args.batch_size).uniform_(args.min_seconds, args.max_seconds, generator=generator)
+        clips = [torch.randn(int(s * sr), generator=generator) * 0.1 for s in seconds]
+
+        reference = per_clip(clips, sr, args.n_mels, args.device)
+        result = batched(clips, sr, args.n_mels, args.device)
+        diff = max((r - m[0]).abs().max().item() for r, m in zip(reference, result))
+
+        per_clip_ms = timed(lambda: per_clip(clips, sr, args.n_mels, args.device), args.iterations, args.device)
+        batched_ms = timed(lambda: batched(clips, sr, args.n_mels, args.device), args.iterations, args.device)
+        print(f"{sr:>7}{per_clip_ms:>13.2f}{batched_ms:>12.2f}{per_clip_ms / batched_ms:>8.2f}x{diff:>12.2e}")
+
+
+if __name__ == "__main__":
+    main()
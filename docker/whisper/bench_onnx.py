@@ -0,0 +1,71 @@
+"""
+Startup time and latency of the ONNX Runtime backend against PyTorch.
+
+Startup covers loading the quantizer weights plus either the PyTorch encoder
+or the exported graph. Latency is the encoder + quantizer time per batch of
+30s windows, and end-to-end `quantize_batch` time over the bundled samples.
+
+Usage: python bench_onnx.py --onnx /models/ichigo-prepared/tokenizer.onnx
+"""
+import argparse
+import time
+
+import torch
+import whisper
+
+from audio import AudioProcessor
+from onnx_backend import OnnxEncoderRunner
+from utils import ICHIGO_NAME, MODEL_SIZE, SAMPLES, load_model, timed
+
+
+def load(onnx_path=None):
+    start = time.perf_counter()
+    model = load_model(ref=ICHIGO_NAME, size=MODEL_SIZE)
+    if onnx_path:
+        model.use_graph(OnnxEncoderRunner(onnx_path))
+    else:
+        model.setup(device="cpu")
+    model.to("cpu")
+    return model, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--onnx", required=True, help="Graph written by export_onnx.py")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    processor = AudioProcessor()
+    clips = []
+    for path, format in SAMPLES.items():
+        with open(path, "rb") as f:
+            clips.append(processor.decode(f.read(), format)[0])
+
+    models = {}
+    print(f"{'backend':<8}{'startup s':>11}")
+    for name, onnx_path in (("torch", None), ("onnx", args.onnx)):
+        models[name], seconds = load(onnx_path)
+        print(f"{name:<8}{seconds:>11.2f}")
+
+    n_mels = models["torch"]._n_mels()
+    print(f"\n{'batch':>5}{'torch ms':>10}{'onnx ms':>9}{'speedup':>9}")
+    with torch.no_grad():
+        for batch_size in args.batch_sizes:
+            padded = torch.full((batch_size, n_mels, whisper.audio.N_FRAMES), -1.5)
+            torch_ms, onnx_ms = (
+                timed(lambda: models[name]._encode_padded(padded), args.iterations)
+                for name in ("torch", "onnx")
+            )
+            print(f"{batch_size:>5}{torch_ms:>10.1f}{onnx_ms:>9.1f}{torch_ms / onnx_ms:>8.2f}x")
+
+        torch_ms, onnx_ms = (
+            timed(lambda: models[name].quantize_batch(clips, long_form=True), args.iterations)
+            for name in ("torch", "onnx")
+        )
+    print(f"\nquantize_batch over samples: torch {torch_ms:.1f} ms, onnx {onnx_ms:.1f} ms "
+          f"({torch_ms / onnx_ms:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
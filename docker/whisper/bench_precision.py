@@ -0,0 +1,56 @@
+"""
+Accuracy and latency of the tokenizer's reduced-precision modes.
+
+Tokenizes the bundled samples in fp32 and in each other precision mode, and
+reports token agreement with fp32 and the mean latency per clip.
+
+Usage: python bench_precision.py [--device cpu] [--modes bf16 int8]
+"""
+import argparse
+import copy
+
+import torch
+
+from audio import AudioProcessor
+from utils import ICHIGO_NAME, MODEL_SIZE, SAMPLES, load_model, timed
+
+
+def tokenize(model, clips):
+    with torch.no_grad():
+        return [model.quantize_batch([clip], long_form=True)[0] for clip in clips]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--modes", nargs="+", default=["bf16", "int8"])
+    parser.add_argument("--iterations", type=int, default=3)
+    args = parser.parse_args()
+
+    processor = AudioProcessor()
+    clips = []
+    for path, format in SAMPLES.items():
+        with open(path, "rb") as f:
+            clips.append(processor.decode(f.read(), format)[0])
+
+    base = load_model(ref=ICHIGO_NAME, size=MODEL_SIZE)
+    base.setup(device=args.device)
+    base.to(args.device)
+
+    reference = tokenize(base, clips)
+    fp32_ms = timed(lambda: tokenize(base, clips), args.iterations, args.device) / len(clips)
+    print(f"{'mode':<6}{'agreement':>11}{'ms/clip':>10}{'speedup':>9}")
+    print(f"{'fp32':<6}{1.0:>11.3f}{fp32_ms:>10.1f}{1.0:>8.2f}x")
+
+    for mode in args.modes:
+        model = copy.deepcopy(base)
+        model.set_precision(mode)
+        tokens = tokenize(model, clips)
+        agree = sum((t == r).sum().item() for t, r in zip(tokens, reference)) / \
+            sum(r.numel() for r in reference)
+        mode_ms = timed(lambda: tokenize(model, clips), args.iterations, args.device) / len(clips)
+        print(f"{mode:<6}{agree:>11.3f}{mode_ms:>10.1f}{fp32_ms / mode_ms:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+Measure peak RSS of loading the Whisper encoder with each load path.
+
+Every mode runs in a fresh process so peaks do not leak between runs:
+  bytes     - read the whole checkpoint into memory, then torch.load (old path)
+  mmap      - torch.load(mmap=True) straight from the file
+  prepared  - safetensors artifact from prepare.py (needs --prepared-dir)
+
+Usage: python bench_rss.py [--model medium] [--prepared-dir DIR]
+"""
+import argparse
+import multiprocessing as mp
+import os
+import resource
+import time
+
+
+def _load(mode: str, model: str, prepared_dir: str, results):
+    from components import CustomWhisperEncoder
+    from utils import PREPARED_ENCODER_FILE
+
+    start = time.perf_counter()
+    if mode == "prepared":
+        encoder = CustomWhisperEncoder(os.path.join(prepared_dir, PREPARED_ENCODER_FILE), device="cpu")
+    else:
+        encoder = CustomWhisperEncoder(model, device="cpu", in_memory=mode == "bytes")
+    elapsed = time.perf_counter() - start
+    params = sum(p.numel() * p.element_size() for p in encoder.parameters())
+    # ru_maxrss is in KiB on Linux
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    results.put((mode, elapsed, params, peak))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default="medium")
+    parser.add_argument("--prepared-dir", default=None)
+    args = parser.parse_args()
+
+    modes = ["bytes", "mmap"] + (["prepared"] if args.prepared_dir else [])
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+
+    print(f"{'mode':<10}{'load s':>8}{'weights MiB':>13}{'peak RSS MiB':>14}{'RSS/weights':>13}")
+    for mode in modes:
+        proc = ctx.Process(target=_load, args=(mode, args.model, args.prepared_dir, results))
+        proc.start()
+        mode, elapsed, params, peak = results.get()
+        proc.join()
+        print(f"{mode:<10}{elapsed:>8.2f}{params / 2**20:>13.0f}{peak / 2**20:>14.0f}{peak / params:>12.2f}x")
+
+
+if __name__ == "__main__":
+    main()
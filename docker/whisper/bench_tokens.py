@@ -0,0 +1,74 @@
+"""
+Micro-benchmark for sound token string formatting.
+
+Compares the previous nested-loop run-length encoder with the vectorized
+`convert_ids_to_tokens` on realistic 750-token sequences (one 30s window)
+and on batches of them.
+
+Usage: python bench_tokens.py [--batch-size 32]
+"""
+import argparse
+import timeit
+
+import numpy as np
+import torch
+
+from utils import convert_batch_ids_to_tokens, convert_ids_to_tokens, convert_tokens_to_ids
+
+
+def convert_ids_to_tokens_loop(id_list):
+    """The previous implementation, kept as the baseline"""
+    if not id_list:
+        return "<|sound_start|><|sound_end|>"
+    result = ["<|sound_start|>"]
+    i = 0
+    while i < len(id_list):
+        current_id = id_list[i]
+        count = 1
+        while i + count < len(id_list) and id_list[i + count] == current_id:
+            count += 1
+        if count > 1:
+            result.append(f"<|duration_{str(count).zfill(2)}|>")
+        result.append(f"<|sound_{str(current_id).zfill(4)}|>")
+        i += count
+    result.append("<|sound_end|>")
+    return "".join(result)
+
+
+def make_sequence(rng, length=750, vq_codes=2560, mean_run=1.6):
+    """Random codes with geometric run lengths, similar to real speech stoks"""
+    runs = rng.geometric(1 / mean_run, size=length)
+    values = rng.integers(0, vq_codes, size=length)
+    return torch.from_numpy(np.repeat(values, runs)[:length])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--number", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    codes = make_sequence(rng)
+    batch = torch.stack([make_sequence(rng) for _ in range(args.batch_size)])
+
+    # Same output as the old implementation, and round-trips
+    assert convert_ids_to_tokens(codes) == convert_ids_to_tokens_loop(codes.tolist())
+    assert np.array_equal(convert_tokens_to_ids(convert_ids_to_tokens(codes)), codes.numpy())
+
+    tokens = convert_ids_to_tokens(codes)
+    cases = {
+        "loop (tensor -> tolist)": lambda: convert_ids_to_tokens_loop(codes.tolist()),
+        "vectorized (tensor)": lambda: convert_ids_to_tokens(codes),
+        f"loop batch x{args.batch_size}": lambda: [
+            convert_ids_to_tokens_loop(row) for row in batch.tolist()],
+        f"vectorized batch x{args.batch_size}": lambda: convert_batch_ids_to_tokens(batch),
+        "decode tokens -> ids": lambda: convert_tokens_to_ids(tokens),
+    }
+    for name, fn in cases.items():
+        seconds = timeit.timeit(fn, number=args.number) / args.number
+        print(f"{name:<28}{seconds * 1e6:>10.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class TokenCache:
+    """
+    Content-addressed cache of tokenization results (encoded sound codes).
+
+    Entries are keyed by a hash of the raw upload bytes and a namespace
+    describing the model (name, size and tokenization options), so a model
+    change never serves stale tokens. The in-process tier is an LRU bounded
+    by bytes; the optional disk tier survives restarts. Methods are
+    thread-safe so lookups, hashing and disk I/O can run off the event loop.
+    """
+
+    def __init__(self, namespace: str, max_bytes: int = 64 << 20, disk_dir: Optional[str] = None):
+        self.namespace = namespace.encode()
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self.current_bytes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def key(self, data: bytes, format: str = "") -> str:
+        """Key of `data` decoded as `format`; the same bytes in another format are other audio"""
+        digest = hashlib.sha256(self.namespace)
+        digest.update(b"\0")
+        digest.update(format.encode())
+        digest.update(b"\0")
+        digest.update(data)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return value
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is not None:
+                self.disk_hits += 1
+                self._put_memory(key, value)
+                return value
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: bytes):
+        with self._lock:
+            self._put_memory(key, value)
+        self._write_disk(key, value)
+
+    def _put_memory(self, key: str, value: bytes):
+        # Caller holds self._lock
+        size = len(value)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.current_bytes -= len(self._entries.pop(key))
+        self._entries[key] = value
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= len(evicted)
+            self.evictions += 1
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, key[:2], f"{key}.bin")
+
+    def _read_disk(self, key: str) -> Optional[bytes]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Error reading token cache entry {key}: {e}")
+            return None
+
+    def _write_disk(self, key: str, value: bytes):
+        if not self.disk_dir:
+            return
+        path = self._disk_path(key)
+        tmp_path = None
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename so readers never see a partial entry
+            with tempfile.NamedTemporaryFile(
+                "wb", dir=os.path.dirname(path), delete=False
+            ) as f:
+                tmp_path = f.name
+                f.write(value)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Error writing token cache entry {key}: {e}")
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+
+    def stats(self) -> dict:
+        with self._lock:
+            return self._stats()
+
+    def _stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "disk_dir": self.disk_dir,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+        }
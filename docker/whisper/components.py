@@ -11,9 +11,11 @@ import torch.nn.functional as F
 import os
 from typing import List, Optional, Union
 import io
+import json
 import urllib
 from tqdm import tqdm
 import torchaudio
+from frontend import log_mel_spectrogram_batch, resample, resample_batch
 
 _HF_MODELS = {  
     "medium": "https://huggingface.co/jan-hq/WhisperVQ/resolve/main/medium_encoder_only.pt",
@@ -30,9 +32,10 @@ def _download(url: str, root: str, in_memory: bool) -> Union[bytes, str]:
         raise RuntimeError(f"{download_target} exists and is not a regular file")
 
     if os.path.isfile(download_target):
+        if not in_memory:
+            return download_target
         with open(download_target, "rb") as f:
-            model_bytes = f.read()
-        return model_bytes if in_memory else download_target
+            return f.read()
 
     with urllib.request.urlopen(url) as source, open(download_target, "wb") as output:
         with tqdm(
@@ -50,8 +53,42 @@ def _download(url: str, root: str, in_memory: bool) -> Union[bytes, str]:
                 output.write(buffer)
                 loop.update(len(buffer))
 
-    model_bytes = open(download_target, "rb").read()
-    return model_bytes if in_memory else download_target
+    if not in_memory:
+        return download_target
+    with open(download_target, "rb") as f:
+        return f.read()
+
+def _load_checkpoint(checkpoint_file: Union[bytes, str], in_memory: bool) -> dict:
+    """
+    Load a checkpoint on CPU. Files are memory-mapped, so worker processes on
+    one host share the page cache instead of each holding a private copy.
+    """
+    if in_memory:
+        return torch.load(io.BytesIO(checkpoint_file), map_location="cpu")
+    try:
+        return torch.load(checkpoint_file, map_location="cpu", mmap=True)
+    except RuntimeError:
+        # Legacy (non-zipfile) checkpoints cannot be memory-mapped
+        return torch.load(checkpoint_file, map_location="cpu")
+
+def _float32_state_dict(state_dict: dict) -> dict:
+    """
+    Cast floating tensors to fp32. `load_state_dict(assign=True)` adopts the
+    checkpoint dtype, and half-precision parameters would break LayerNorm on
+    CPU and int8 dynamic quantization; fp32 tensors are kept as loaded.
+    """
+    return {
+        k: v.float() if v.is_floating_point() and v.dtype != torch.float32 else v
+        for k, v in state_dict.items()
+    }
+
+def _load_prepared_checkpoint(path: str, device: str) -> dict:
+    """Load encoder weights saved by prepare.py (safetensors + dims sidecar)"""
+    from safetensors.torch import load_file
+
+    with open(os.path.splitext(path)[0] + ".json") as f:
+        dims = json.load(f)
+    return {"dims": dims, "model_state_dict": load_file(path, device=str(device))}
 
 # Models Definitions
 class CustomWhisperEncoder(nn.Module):
@@ -66,22 +103,24 @@ class CustomWhisperEncoder(nn.Module):
             default = os.path.join(os.path.expanduser("~"), ".cache")
             download_root = os.path.join(os.getenv("XDG_CACHE_HOME", default), "whisper")
 
-        if name in _HF_MODELS:
-            checkpoint_file = _download(_HF_MODELS[name], download_root, in_memory)
-        elif os.path.isfile(name):
-            checkpoint_file = open(name, "rb").read() if in_memory else name
+        if name.endswith(".safetensors") and os.path.isfile(name):
+            # Prepared artifact, loaded without reading the file into memory
+            checkpoint = _load_prepared_checkpoint(name, device)
         else:
-            raise RuntimeError(
-                f"Model {name} not found; available models = {available_models()}"
-            )
-        
-        # Load weights
-        with (
-            io.BytesIO(checkpoint_file) if in_memory else open(checkpoint_file, "rb")
-        ) as fp:
-            checkpoint = torch.load(fp, map_location=device)
-        del checkpoint_file
+            if name in _HF_MODELS:
+                checkpoint_file = _download(_HF_MODELS[name], download_root, in_memory)
+            elif os.path.isfile(name):
+                checkpoint_file = open(name, "rb").read() if in_memory else name
+            else:
+                raise RuntimeError(
+                    f"Model {name} not found; available models = {available_models()}"
+                )
+
+            # Load weights; from a path they are mmap-ed rather than read into memory
+            checkpoint = _load_checkpoint(checkpoint_file, in_memory)
+            del checkpoint_file
         dims = ModelDimensions(**checkpoint["dims"])
+        self.dims = dims
         self.encoder = AudioEncoder(
             dims.n_mels,
             dims.n_audio_ctx,
@@ -90,7 +129,9 @@ class CustomWhisperEncoder(nn.Module):
             dims.n_audio_layer,
         )
         
-        self.encoder.load_state_dict(checkpoint["model_state_dict"])
+        # assign=True keeps the (page-cache backed) loaded tensors instead of copying
+        self.encoder.load_state_dict(
+            _float32_state_dict(checkpoint["model_state_dict"]), assign=True)
         
         if device:
             self.to(device)
@@ -98,56 +139,244 @@ class CustomWhisperEncoder(nn.Module):
         self.eval()
 
     def forward(self, mel: torch.Tensor):
-        return self.encoder(mel)
+        """
+        Encode a mel batch of up to 30s. Shorter inputs (an even number of
+        frames) use a truncated context with sliced positional embeddings.
+        """
+        encoder = self.encoder
+        if mel.shape[-1] == whisper.audio.N_FRAMES:
+            return encoder(mel)
+        x = F.gelu(encoder.conv1(mel))
+        x = F.gelu(encoder.conv2(x))
+        x = x.permute(0, 2, 1)
+        x = (x + encoder.positional_embedding[: x.shape[1]]).to(x.dtype)
+        for block in encoder.blocks:
+            x = block(x)
+        return encoder.ln_post(x)
     
+# Encoder precision modes, see IchigoTokenizer.set_precision
+PRECISIONS = ("fp32", "bf16", "int8")
+
 class IchigoTokenizer(RQBottleneckTransformer):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.precision = "fp32"
+        # Exported graph replacing the encoder and quantizer, see use_graph
+        self.graph_runner = None
 
-    def load_encoder(self, device=None):
+    def use_graph(self, runner):
+        """
+        Serve the encoder + quantizer from an exported graph runner (see
+        onnx_backend.OnnxEncoderRunner) instead of PyTorch. The front-end and
+        windowing are unchanged; the graph always takes a 30s context.
+        """
+        self.graph_runner = runner
+        self.tokenizer = whisper.tokenizer.get_tokenizer(True)
+
+    def _n_mels(self):
+        if self.graph_runner is not None:
+            return self.graph_runner.n_mels
+        return self.whmodel[0].dims.n_mels
+
+    def set_precision(self, precision: str):
+        """
+        Select the encoder precision after `setup`: "fp32", "bf16" (autocast
+        around the encoder) or "int8" (dynamic quantization of the encoder's
+        linear layers, CPU only). The quantizer always runs in fp32.
+        """
+        if precision not in PRECISIONS:
+            raise ValueError(f"Unknown precision {precision}; expected one of {PRECISIONS}")
+        if precision == "int8":
+            encoder = self.whmodel[0]
+            if encoder.encoder.conv1.weight.device.type != "cpu":
+                raise ValueError("int8 dynamic quantization is only supported on CPU")
+            # Whisper's Linear subclass only overrides forward; quantize_dynamic
+            # swaps exact nn.Linear modules, so demote them first
+            for module in encoder.modules():
+                if isinstance(module, nn.Linear):
+                    module.__class__ = nn.Linear
+            encoder.encoder = torch.ao.quantization.quantize_dynamic(
+                encoder.encoder, {nn.Linear}, dtype=torch.qint8)
+        self.precision = precision
+
+    def load_encoder(self, device=None, encoder_path=None):
         if self.whmodel is not None: return
         device = device or self.device
         # Use our custom encoder-only model
         if self.whmodel is None:
-            encoder = CustomWhisperEncoder(self.whisper_model_name, device=device)
+            encoder = CustomWhisperEncoder(encoder_path or self.whisper_model_name, device=device)
             self.whmodel = [encoder]
         multilingual = True
         self.tokenizer = whisper.tokenizer.get_tokenizer(multilingual)
     # @override
-    def setup(self, device):
-        """Setup the model on specified device"""
-        self.load_encoder(device=device)
-    @torch.no_grad()
-    def quantize(self, audio):
-        if isinstance(audio, str):
-            x, sr = torchaudio.load(audio)
-            x = torchaudio.transforms.Resample(sr, 16000)(x)[0]
-            audio = x.unsqueeze(0)
-        # Encode Mel
-        mel = self.log_mel_spectrogram(audio)
+    def setup(self, device, encoder_path=None):
+        """Setup the model on specified device, optionally from a prepared encoder file"""
+        self.load_encoder(device=device, encoder_path=encoder_path)
+    def _pad_mel(self, mel, n_ctx=whisper.audio.N_FRAMES):
+        """Pad (or truncate) a mel spectrogram to `n_ctx` frames (30s by default)"""
         n = mel.shape[-1]
+        if n > n_ctx:
+            return mel[:, :, :n_ctx], n_ctx
+        return F.pad(mel, (0, n_ctx - n), value=-1.5), n
 
-        if n > whisper.audio.N_FRAMES:
-            padding = 0
-            padded = mel[:, :, : whisper.audio.N_FRAMES]
-            n = whisper.audio.N_FRAMES
-        else:
-            padding = -n % whisper.audio.N_FRAMES
-            padded = F.pad(mel, (0, padding), value=-1.5)
+    def _context_frames(self, n_frames, bucket_frames=None):
+        """Encoder context for `n_frames`, rounded up to a multiple of `bucket_frames`"""
+        if not bucket_frames or self.graph_runner is not None:
+            return whisper.audio.N_FRAMES
+        frames_per_token = 2 * self.downsample
+        bucket = max(frames_per_token, bucket_frames // frames_per_token * frames_per_token)
+        n_ctx = max(bucket, -(-n_frames // bucket) * bucket)
+        return min(whisper.audio.N_FRAMES, n_ctx)
 
-        embs = self.whmodel[0].encoder(padded)
+    def _encode_padded(self, padded):
+        """Run the Whisper encoder and the RQ bottleneck on a padded mel batch"""
+        if self.graph_runner is not None:
+            return self.graph_runner(padded)
+        with torch.autocast(
+            device_type=padded.device.type,
+            dtype=torch.bfloat16,
+            enabled=self.precision == "bf16",
+        ):
+            embs = self.whmodel[0](padded)
+        embs = embs.float()
         # Quantize
         x = self.downsample_embeddings(embs)
         x = x + self.mlp(self.mlp_ln(x))
         _, stoks, _ = self.rq(x)
-        stoks = stoks.squeeze(-1)
+        return stoks.squeeze(-1)
+
+    def _n_tokens(self, n_frames):
+        return n_frames // 2 // self.downsample
+
+    def _encode_batched(self, padded, max_forward_batch=None):
+        """Encode a list of padded mels, at most `max_forward_batch` per forward"""
+        step = max_forward_batch or len(padded)
+        return torch.cat([
+            self._encode_padded(torch.cat(padded[i: i + step]))
+            for i in range(0, len(padded), step)
+        ])
+
+    def _split_windows(self, mel, overlap_frames=0, boundary_search_frames=0):
+        """
+        Split a [1, n_mels, n] mel into 30s encoder windows for long-form audio
+
+        Windows share `overlap_frames` of context on each side of a cut. With
+        `boundary_search_frames`, each cut moves back to the lowest-energy
+        frame within that range so words are not split mid-way.
+
+        Returns:
+            Tuple[list, list]: Unpadded mel windows, and for each window the
+            (start, end) range of its tokens that belongs to the stitched output
+        """
+        n = mel.shape[-1]
+        n_ctx = whisper.audio.N_FRAMES
+        frames_per_token = 2 * self.downsample
+        # Cuts and overlaps are aligned to token boundaries
+        overlap = min(overlap_frames, n_ctx // 4) // frames_per_token * frames_per_token
+        search = max(0, min(boundary_search_frames, n_ctx - 2 * overlap - frames_per_token))
+
+        cuts = [0]
+        while n - max(0, cuts[-1] - overlap) > n_ctx:
+            cut = max(0, cuts[-1] - overlap) + n_ctx - overlap
+            if search:
+                energy = mel[0, :, cut - search: cut].mean(dim=0)
+                cut = cut - search + int(energy.argmin())
+            cuts.append(cut // frames_per_token * frames_per_token)
+        cuts.append(n)
+
+        windows, spans = [], []
+        for lo, hi in zip(cuts[:-1], cuts[1:]):
+            start, stop = max(0, lo - overlap), min(n, hi + overlap)
+            windows.append(mel[:, :, start:stop])
+            spans.append(((lo - start) // frames_per_token,
+                          (hi - start) // frames_per_token))
+        return windows, spans
+
+    @torch.no_grad()
+    def quantize(self, audio, long_form: bool = False, bucket_frames: Optional[int] = None):
+        if isinstance(audio, str):
+            x, sr = torchaudio.load(audio)
+            x = resample(x, sr)[0]
+            audio = x.unsqueeze(0)
+        if long_form or bucket_frames:
+            return self.quantize_batch(
+                [audio], long_form=long_form, bucket_frames=bucket_frames)[0].unsqueeze(0)
+        # Encode Mel
+        if self.graph_runner is not None:
+            mel = whisper.log_mel_spectrogram(audio, self._n_mels())
+        else:
+            mel = self.log_mel_spectrogram(audio)
+        padded, n = self._pad_mel(mel)
+        stoks = self._encode_padded(padded)
 
         # PAD token
         if self.config.mask_embs:
-            return stoks[:, : n // 2 // self.downsample]
+            return stoks[:, : self._n_tokens(n)]
         else:
             return stoks
 
+    @torch.no_grad()
+    def quantize_batch(
+        self,
+        audios: List[torch.Tensor],
+        long_form: bool = False,
+        overlap_frames: int = 0,
+        boundary_search_frames: int = 0,
+        max_forward_batch: Optional[int] = None,
+        bucket_frames: Optional[int] = None,
+        sample_rates: Optional[List[int]] = None,
+    ) -> List[torch.Tensor]:
+        """
+        Quantize several mono waveforms with a single encoder forward
+
+        Args:
+            audios: List of [1, T] waveforms sampled at 16 kHz, or at
+                `sample_rates` if given
+            long_form: Split clips longer than 30s into windows and stitch
+                their tokens instead of truncating
+            overlap_frames: Mel frames of context shared by adjacent windows
+            boundary_search_frames: Mel frames searched for a quiet cut point
+            max_forward_batch: Upper bound on windows per encoder forward
+            bucket_frames: Run the encoder on the batch's longest input
+                rounded up to this many frames instead of the full 30s context
+            sample_rates: Per-clip sample rates; clips are then resampled
+                on the model device, batched per rate
+
+        Returns:
+            List[torch.Tensor]: One 1-D tensor of sound token ids per clip
+        """
+        clips = [audio.reshape(-1) for audio in audios]
+        if sample_rates is not None:
+            clips = resample_batch(clips, sample_rates, self.device)
+        mels = log_mel_spectrogram_batch(clips, self._n_mels(), self.device)
+
+        if long_form:
+            # Windows of every clip go through the encoder together
+            windows, spans, owners = [], [], []
+            for i, mel in enumerate(mels):
+                clip_windows, clip_spans = self._split_windows(
+                    mel, overlap_frames, boundary_search_frames)
+                windows += clip_windows
+                spans += clip_spans
+                owners += [i] * len(clip_windows)
+        else:
+            windows = [mel[:, :, : whisper.audio.N_FRAMES] for mel in mels]
+            owners = list(range(len(mels)))
+            # PAD token, trimmed per clip using its true length
+            if self.config.mask_embs:
+                spans = [(0, self._n_tokens(w.shape[-1])) for w in windows]
+            else:
+                spans = [(0, None)] * len(windows)
+
+        n_ctx = self._context_frames(max(w.shape[-1] for w in windows), bucket_frames)
+        padded = [self._pad_mel(w, n_ctx)[0] for w in windows]
+        stoks = self._encode_batched(padded, max_forward_batch)
+
+        pieces = [[] for _ in audios]
+        for owner, (start, end), s in zip(owners, spans, stoks):
+            pieces[owner].append(s[start:end])
+        return [torch.cat(p) for p in pieces]
+
 if __name__ == "__main__":
     # Load the model
     print("do nothing")
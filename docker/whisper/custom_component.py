@@ -28,9 +28,10 @@ def _download(url: str, root: str, in_memory: bool) -> Union[bytes, str]:
         raise RuntimeError(f"{download_target} exists and is not a regular file")
 
     if os.path.isfile(download_target):
+        if not in_memory:
+            return download_target
         with open(download_target, "rb") as f:
-            model_bytes = f.read()
-        return model_bytes if in_memory else download_target
+            return f.read()
 
     with urllib.request.urlopen(url) as source, open(download_target, "wb") as output:
         with tqdm(
@@ -48,8 +49,34 @@ def _download(url: str, root: str, in_memory: bool) -> Union[bytes, str]:
                 output.write(buffer)
                 loop.update(len(buffer))
 
-    model_bytes = open(download_target, "rb").read()
-    return model_bytes if in_memory else download_target
+    if not in_memory:
+        return download_target
+    with open(download_target, "rb") as f:
+        return f.read()
+def _load_checkpoint(checkpoint_file: Union[bytes, str], in_memory: bool) -> dict:
+    """
+    Load a checkpoint on CPU. Files are memory-mapped, so worker processes on
+    one host share the page cache instead of each holding a private copy.
+    """
+    if in_memory:
+        return torch.load(io.BytesIO(checkpoint_file), map_location="cpu")
+    try:
+        return torch.load(checkpoint_file, map_location="cpu", mmap=True)
+    except RuntimeError:
+        # Legacy (non-zipfile) checkpoints cannot be memory-mapped
+        return torch.load(checkpoint_file, map_location="cpu")
+
+def _float32_state_dict(state_dict: dict) -> dict:
+    """
+    Cast floating tensors to fp32. `load_state_dict(assign=True)` adopts the
+    checkpoint dtype, and half-precision parameters would break LayerNorm on
+    CPU and int8 dynamic quantization; fp32 tensors are kept as loaded.
+    """
+    return {
+        k: v.float() if v.is_floating_point() and v.dtype != torch.float32 else v
+        for k, v in state_dict.items()
+    }
+
 class CustomWhisperEncoder(nn.Module):
     """
     Lightweight wrapper that only loads the AudioEncoder part of Whisper
@@ -71,11 +98,8 @@ class CustomWhisperEncoder(nn.Module):
                 f"Model {name} not found; available models = {available_models()}"
             )
         
-        # Load weights
-        with (
-            io.BytesIO(checkpoint_file) if in_memory else open(checkpoint_file, "rb")
-        ) as fp:
-            checkpoint = torch.load(fp, map_location=device)
+        # Load weights; from a path they are mmap-ed rather than read into memory
+        checkpoint = _load_checkpoint(checkpoint_file, in_memory)
         del checkpoint_file
         dims = ModelDimensions(**checkpoint["dims"])
         self.encoder = AudioEncoder(
@@ -86,7 +110,9 @@ class CustomWhisperEncoder(nn.Module):
             dims.n_audio_layer,
         )
         
-        self.encoder.load_state_dict(checkpoint["model_state_dict"])
+        # assign=True keeps the (page-cache backed) loaded tensors instead of copying
+        self.encoder.load_state_dict(
+            _float32_state_dict(checkpoint["model_state_dict"]), assign=True)
         
         if device:
             self.to(device)
@@ -0,0 +1,79 @@
+"""
+Export the tokenizer's encoder + quantizer to ONNX and check it against PyTorch.
+
+The graph is written to OUT (serve it with WHISPER_BACKEND=onnx and
+WHISPER_ONNX_PATH, or name it tokenizer.onnx inside WHISPER_PREPARED_DIR).
+Unless --skip-check is given, the bundled samples and random clips of several
+lengths are then tokenized with `IchigoTokenizer.quantize` and with the
+exported graph, and the run fails if token agreement is below --min-agreement.
+
+Usage: python export_onnx.py --out /models/ichigo-prepared/tokenizer.onnx
+"""
+import argparse
+import sys
+import time
+
+import torch
+
+from audio import AudioProcessor
+from onnx_backend import OnnxEncoderRunner, export_onnx
+from utils import ICHIGO_NAME, MODEL_SIZE, SAMPLES, load_model
+
+RANDOM_SECONDS = [1, 7.5, 29]
+
+
+def check_parity(torch_model, onnx_model, min_agreement):
+    processor = AudioProcessor()
+    clips = {}
+    for path, format in SAMPLES.items():
+        with open(path, "rb") as f:
+            clips[path] = processor.decode(f.read(), format)[0]
+    generator = torch.Generator().manual_seed(0)
+    for seconds in RANDOM_SECONDS:
+        clips[f"random {seconds}s"] = torch.randn(1, int(seconds * 16000), generator=generator) * 0.1
+
+    matched, total = 0, 0
+    for name, clip in clips.items():
+        expected = torch_model.quantize(clip)
+        actual = onnx_model.quantize(clip)
+        if expected.shape != actual.shape:
+            print(f"{name}: shape mismatch {tuple(actual.shape)} != {tuple(expected.shape)}")
+            return False
+        same = (expected == actual).sum().item()
+        matched += same
+        total += expected.numel()
+        print(f"{name}: {same}/{expected.numel()} tokens match")
+
+    agreement = matched / max(total, 1)
+    print(f"Overall agreement {agreement:.4f} (minimum {min_agreement})")
+    return agreement >= min_agreement
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ref", default=ICHIGO_NAME)
+    parser.add_argument("--size", default=MODEL_SIZE)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--opset", type=int, default=17)
+    parser.add_argument("--skip-check", action="store_true")
+    parser.add_argument("--min-agreement", type=float, default=0.99)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    torch_model = load_model(ref=args.ref, size=args.size)
+    torch_model.setup(device="cpu")
+    torch_model.to("cpu")
+    export_onnx(torch_model, args.out, opset=args.opset)
+    print(f"Exported {args.out} in {time.perf_counter() - start:.1f}s")
+
+    if args.skip_check:
+        return
+    onnx_model = load_model(ref=args.ref, size=args.size)
+    onnx_model.use_graph(OnnxEncoderRunner(args.out))
+    onnx_model.to("cpu")
+    if not check_parity(torch_model, onnx_model, args.min_agreement):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
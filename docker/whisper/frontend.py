@@ -0,0 +1,119 @@
+"""
+Batched audio front-end: resampling and log-mel extraction for many clips.
+"""
+from functools import lru_cache
+from typing import List, Optional, Sequence
+
+import torch
+import torch.nn.functional as F
+import torchaudio
+import whisper
+from whisper.audio import HOP_LENGTH, N_FFT, SAMPLE_RATE
+
+
+# Accepted input sample rates
+MIN_SAMPLE_RATE = 8000
+MAX_SAMPLE_RATE = 192000
+
+# Kernel size grows with orig_sr / gcd(orig_sr, target_sr), up to ~1 GB for
+# co-prime rates, so only kernels between common rates are kept
+CACHED_SAMPLE_RATES = frozenset({
+    8000, 11025, 12000, 16000, 22050, 24000, 32000, 44100, 48000, 88200, 96000, 176400, 192000,
+})
+
+
+def check_sample_rate(sr: int):
+    if not MIN_SAMPLE_RATE <= sr <= MAX_SAMPLE_RATE:
+        raise ValueError(f"Sample rate {sr} outside {MIN_SAMPLE_RATE}-{MAX_SAMPLE_RATE} Hz")
+
+
+@lru_cache(maxsize=32)
+def _cached_resampler(orig_sr: int, target_sr: int, device: str) -> torchaudio.transforms.Resample:
+    return torchaudio.transforms.Resample(orig_sr, target_sr).to(device)
+
+
+def get_resampler(orig_sr: int, target_sr: int, device: str) -> torchaudio.transforms.Resample:
+    """Resample module; kernels between common rates are built once per device"""
+    if orig_sr in CACHED_SAMPLE_RATES and target_sr in CACHED_SAMPLE_RATES:
+        return _cached_resampler(orig_sr, target_sr, device)
+    return torchaudio.transforms.Resample(orig_sr, target_sr).to(device)
+
+
+@lru_cache(maxsize=None)
+def _hann_window(device: str) -> torch.Tensor:
+    return torch.hann_window(N_FFT, device=device)
+
+
+def resample(wav: torch.Tensor, orig_sr: int, target_sr: int = SAMPLE_RATE) -> torch.Tensor:
+    """Resample [..., T] audio with a cached kernel on the audio's device"""
+    if orig_sr == target_sr:
+        return wav
+    return get_resampler(orig_sr, target_sr, str(wav.device))(wav)
+
+
+def _pad_stack(audios: Sequence[torch.Tensor]) -> torch.Tensor:
+    longest = max(a.shape[-1] for a in audios)
+    return torch.stack([F.pad(a, (0, longest - a.shape[-1])) for a in audios])
+
+
+def resample_batch(
+    audios: Sequence[torch.Tensor],
+    sample_rates: Sequence[int],
+    device: str,
+    target_sr: int = SAMPLE_RATE,
+) -> List[torch.Tensor]:
+    """
+    Resample 1-D clips to `target_sr` on `device`, one batched call per source rate.
+
+    Clips are zero-padded to a common length, which matches the zero padding
+    the resampler applies at the end of each clip, so results equal resampling
+    each clip on its own.
+    """
+    out: List[Optional[torch.Tensor]] = [None] * len(audios)
+    for sr in set(sample_rates):
+        indices = [i for i, s in enumerate(sample_rates) if s == sr]
+        clips = [audios[i].to(device) for i in indices]
+        if sr == target_sr:
+            resampled = clips
+        else:
+            batch = get_resampler(sr, target_sr, str(device))(_pad_stack(clips))
+            lengths = [-(-c.shape[-1] * target_sr // sr) for c in clips]
+            resampled = [batch[j, :n] for j, n in enumerate(lengths)]
+        for i, clip in zip(indices, resampled):
+            out[i] = clip
+    return out
+
+
+def log_mel_spectrogram_batch(audios: Sequence[torch.Tensor], n_mels: int, device: str) -> List[torch.Tensor]:
+    """
+    Batched equivalent of `whisper.log_mel_spectrogram` for 16 kHz 1-D clips.
+
+    Each clip is reflect-padded on its own (as the centred STFT does) before
+    the batch is zero-padded, and the dynamic range clamp uses each clip's own
+    maximum, so every output matches the per-clip function.
+
+    Returns:
+        List[torch.Tensor]: One [1, n_mels, n_frames] spectrogram per clip
+    """
+    pad = N_FFT // 2
+    if any(a.shape[-1] <= pad for a in audios):
+        # Too short to reflect-pad; the per-clip function handles (or rejects) these
+        return [whisper.log_mel_spectrogram(a.to(device), n_mels).unsqueeze(0) for a in audios]
+
+    audios = [a.to(device) for a in audios]
+    n_frames = [a.shape[-1] // HOP_LENGTH for a in audios]
+    padded = _pad_stack([F.pad(a[None], (pad, pad), mode="reflect")[0] for a in audios])
+
+    stft = torch.stft(
+        padded, N_FFT, HOP_LENGTH, window=_hann_window(str(device)),
+        center=False, return_complex=True)
+    magnitudes = stft.abs() ** 2
+    mel_spec = whisper.audio.mel_filters(device, n_mels) @ magnitudes
+    log_spec = torch.clamp(mel_spec, min=1e-10).log10()
+
+    mels = []
+    for i, n in enumerate(n_frames):
+        spec = log_spec[i, :, :n]
+        spec = torch.maximum(spec, spec.max() - 8.0)
+        mels.append(((spec + 4.0) / 4.0).unsqueeze(0))
+    return mels
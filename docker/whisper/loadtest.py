@@ -0,0 +1,235 @@
+"""
+Load test for the whisper tokenizer service.
+
+Closed-loop clients post synthetic clips to /tokenize/{format} and report
+throughput, latency percentiles (overall and per format) and, from /metrics
+scraped before and after the run, the mean time of each tokenization stage.
+
+Without --url the app runs in-process over ASGI, by default with the stub
+tokenizer (WHISPER_BACKEND=stub) and the token cache off, so a run needs no
+GPU or model weights. Against a URL, use a large --pool-size or start the
+server with WHISPER_CACHE_MB=0 so repeated clips do not hit the cache.
+
+Usage:
+    python loadtest.py --concurrency 16 --requests 500
+    python loadtest.py --url http://localhost:3348 --formats wav:2,mp3:1,pcm:1 --lengths uniform:1:60
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import random
+import time
+from collections import Counter, defaultdict
+
+import httpx
+import numpy as np
+import torch
+import torchaudio
+from prometheus_client.parser import text_string_to_metric_families
+
+# Formats whose container name differs from the format name
+CONTAINERS = {"opus": "ogg"}
+
+
+def parse_formats(spec: str) -> dict:
+    """"wav:2,mp3:1" -> {"wav": 2.0, "mp3": 1.0}; a bare format has weight 1"""
+    weights = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition(":")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def sample_seconds(spec: str, rng: random.Random) -> float:
+    """Clip length from "fixed:S", "uniform:LO:HI" or "lognormal:MU:SIGMA" (seconds)"""
+    kind, *params = spec.split(":")
+    params = [float(p) for p in params]
+    if kind == "fixed":
+        return params[0]
+    if kind == "uniform":
+        return rng.uniform(*params)
+    if kind == "lognormal":
+        return rng.lognormvariate(*params)
+    raise ValueError(f"Unknown length distribution {spec}")
+
+
+def synth_clip(seconds: float, sample_rate: int, rng: random.Random) -> torch.Tensor:
+    """A few drifting tones plus noise, so every clip has distinct content"""
+    t = torch.arange(int(seconds * sample_rate)) / sample_rate
+    wav = 0.02 * torch.randn(t.shape, generator=torch.Generator().manual_seed(rng.randrange(1 << 31)))
+    for _ in range(3):
+        freq = rng.uniform(100, 2000)
+        wav += 0.1 * torch.sin(2 * torch.pi * freq * t * (1 + 0.05 * torch.sin(t)))
+    return wav.clamp(-1, 1).unsqueeze(0)
+
+
+def encode_clip(wav: torch.Tensor, sample_rate: int, format: str) -> bytes:
+    if format == "pcm":
+        return (wav[0] * 32767).to(torch.int16).numpy().tobytes()
+    buffer = io.BytesIO()
+    torchaudio.save(buffer, wav, sample_rate, format=CONTAINERS.get(format, format))
+    return buffer.getvalue()
+
+
+def build_pools(args, rng: random.Random) -> dict:
+    """Pre-encode `pool_size` clips per format so encoding is not timed"""
+    pools = {}
+    for format in parse_formats(args.formats):
+        # The service reads raw PCM as 16 kHz
+        sample_rate = 16000 if format == "pcm" else args.sample_rate
+        clips = []
+        try:
+            for _ in range(args.pool_size):
+                seconds = sample_seconds(args.lengths, rng)
+                clips.append((encode_clip(synth_clip(seconds, sample_rate, rng), sample_rate, format), seconds))
+        except Exception as e:
+            print(f"Skipping {format}: cannot encode test clips ({e})")
+            continue
+        pools[format] = clips
+    if not pools:
+        raise SystemExit("No requested format could be encoded")
+    return pools
+
+
+async def scrape_stages(client: httpx.AsyncClient) -> dict:
+    """Cumulative (seconds, count) per stage from /metrics, empty if unavailable"""
+    try:
+        response = await client.get("/metrics")
+    except httpx.HTTPError:
+        return {}
+    if response.status_code != 200:
+        return {}
+    stages = defaultdict(lambda: [0.0, 0.0])
+    for family in text_string_to_metric_families(response.text):
+        if family.name != "whisper_stage_seconds":
+            continue
+        for sample in family.samples:
+            if sample.name.endswith("_sum"):
+                stages[sample.labels["stage"]][0] = sample.value
+            elif sample.name.endswith("_count"):
+                stages[sample.labels["stage"]][1] = sample.value
+    return stages
+
+
+def percentiles(values) -> dict:
+    if not values:
+        return {}
+    p50, p90, p99 = np.percentile(values, [50, 90, 99]) * 1000
+    return {"count": len(values), "p50_ms": p50, "p90_ms": p90, "p99_ms": p99, "max_ms": max(values) * 1000}
+
+
+async def run(args, client: httpx.AsyncClient) -> dict:
+    rng = random.Random(args.seed)
+    pools = build_pools(args, rng)
+    weights = parse_formats(args.formats)
+    formats = list(pools)
+    format_weights = [weights[f] for f in formats]
+
+    latencies = defaultdict(list)
+    statuses = Counter()
+    audio_seconds = 0.0
+    remaining = args.requests
+
+    async def client_loop(deadline):
+        nonlocal audio_seconds, remaining
+        while remaining > 0 and time.perf_counter() < deadline:
+            remaining -= 1
+            format = rng.choices(formats, format_weights)[0]
+            data, seconds = rng.choice(pools[format])
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"/tokenize/{format}", files={"file": (f"clip.{format}", data)})
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            statuses[status] += 1
+            if status == 200:
+                latencies[format].append(time.perf_counter() - start)
+                audio_seconds += seconds
+
+    before = await scrape_stages(client)
+    start = time.perf_counter()
+    await asyncio.gather(*(client_loop(start + args.duration) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    after = await scrape_stages(client)
+
+    stages = {}
+    for name, (seconds, count) in after.items():
+        seconds -= before.get(name, [0.0, 0.0])[0]
+        count -= before.get(name, [0.0, 0.0])[1]
+        if count:
+            stages[name] = {"count": int(count), "mean_ms": seconds / count * 1000, "total_s": seconds}
+
+    ok = sum(len(v) for v in latencies.values())
+    return {
+        "elapsed_s": elapsed,
+        "requests_per_s": ok / elapsed,
+        "audio_seconds_per_s": audio_seconds / elapsed,
+        "statuses": {str(k): v for k, v in statuses.items()},
+        "latency": percentiles([x for v in latencies.values() for x in v]),
+        "latency_by_format": {f: percentiles(v) for f, v in latencies.items()},
+        "stages": stages,
+    }
+
+
+def print_report(result: dict, args):
+    print(f"\n{args.concurrency} clients, {result['elapsed_s']:.1f}s: "
+          f"{result['requests_per_s']:.1f} req/s, {result['audio_seconds_per_s']:.1f} audio-s/s")
+    print(f"Statuses: {result['statuses']}")
+    print(f"\n{'format':<8}{'count':>7}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}")
+    rows = [("all", result["latency"])] + sorted(result["latency_by_format"].items())
+    for name, p in rows:
+        if p:
+            print(f"{name:<8}{p['count']:>7}{p['p50_ms']:>9.1f}{p['p90_ms']:>9.1f}{p['p99_ms']:>9.1f}{p['max_ms']:>9.1f}")
+    if result["stages"]:
+        print(f"\n{'stage':<24}{'count':>7}{'mean ms':>10}{'total s':>9}")
+        for name, s in result["stages"].items():
+            print(f"{name:<24}{s['count']:>7}{s['mean_ms']:>10.2f}{s['total_s']:>9.2f}")
+
+
+async def main_async(args):
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            return await run(args, client)
+
+    os.environ.setdefault("WHISPER_BACKEND", "stub")
+    os.environ.setdefault("WHISPER_CACHE_MB", "0")
+    import app as service
+
+    # ASGITransport does not run lifespan events, so start the service here
+    await service.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=service.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=args.timeout) as client:
+            return await run(args, client)
+    finally:
+        await service.app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="Service to test; in-process app if omitted")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=float("inf"), help="Stop after this many seconds")
+    parser.add_argument("--formats", default="wav:1,flac:1,mp3:1,pcm:1", help="format:weight mix")
+    parser.add_argument("--lengths", default="uniform:1:15", help="fixed:S, uniform:LO:HI or lognormal:MU:SIGMA")
+    parser.add_argument("--sample-rate", type=int, default=16000, help="Sample rate of non-PCM clips")
+    parser.add_argument("--pool-size", type=int, default=32, help="Distinct clips per format")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Also write the results to this file")
+    args = parser.parse_args()
+
+    result = asyncio.run(main_async(args))
+    print_report(result, args)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Prometheus metrics of the whisper service, exposed at /metrics.
+
+Stage histograms show where tokenization time goes. `upload_read`,
+`load_audio` and `convert_ids_to_tokens` are observed per request;
+`device_transfer` and `quantize` run once per micro-batch and are observed
+per batch. With several workers (serve.py), set PROMETHEUS_MULTIPROC_DIR to
+an empty directory so /metrics aggregates every worker.
+"""
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess)
+
+STAGES = ("upload_read", "load_audio", "device_transfer", "quantize", "convert_ids_to_tokens")
+
+STAGE_SECONDS = Histogram(
+    "whisper_stage_seconds",
+    "Time spent in each tokenization stage",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+REQUESTS = Counter(
+    "whisper_requests_total",
+    "Tokenized uploads by audio format, decode backend and HTTP status",
+    ["format", "backend", "status"],
+)
+AUDIO_SECONDS = Counter(
+    "whisper_audio_seconds_total",
+    "Seconds of audio decoded for tokenization",
+)
+IN_FLIGHT = Gauge(
+    "whisper_requests_in_flight",
+    "Admitted requests currently being processed",
+    multiprocess_mode="livesum",
+)
+
+# Label lookups are resolved once instead of on every observation
+_stage_histograms = {name: STAGE_SECONDS.labels(name) for name in STAGES}
+
+
+def observe_stage(name: str, seconds: float):
+    _stage_histograms[name].observe(seconds)
+
+
+@contextmanager
+def stage(name: str):
+    """Time the enclosed block as one observation of stage `name`"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stage_histograms[name].observe(time.perf_counter() - start)
+
+
+def render_metrics() -> bytes:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
@@ -0,0 +1,106 @@
+"""
+ONNX export of the tokenizer graph and an ONNX Runtime backend serving it.
+
+The exported graph covers padded log-mel -> Whisper encoder -> downsampling ->
+MLP -> nearest quantizer code, i.e. everything `IchigoTokenizer._encode_padded`
+runs. Resampling, the log-mel front-end and long-form windowing stay in
+PyTorch (`frontend.py`, `IchigoTokenizer.quantize_batch`): the complex STFT
+does not export, and the windowing is data-dependent Python.
+"""
+import os
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+import whisper
+
+# File name of the exported graph inside a prepared artifact directory
+ONNX_GRAPH_FILE = "tokenizer.onnx"
+
+
+class TokenizerGraph(nn.Module):
+    """
+    Export-friendly equivalent of `IchigoTokenizer._encode_padded` for 30s
+    mel windows. The residual quantizer's nearest-code search is written out
+    as a matmul + argmax over its (single) codebook.
+    """
+
+    def __init__(self, model):
+        super().__init__()
+        encoder = model.whmodel[0]
+        # Unwrap torch.compile; export traces the eager module
+        self.encoder = getattr(encoder, "_orig_mod", encoder)
+        self.model = model
+
+        rq = model.rq
+        if len(rq.layers) != 1:
+            raise ValueError(f"Only single-level quantizers can be exported, got {len(rq.layers)}")
+        layer = rq.layers[0]
+        self.cosine = type(layer._codebook).__name__ == "CosineSimCodebook"
+        codebook = layer._codebook.embed[0].detach().float()
+        if self.cosine:
+            codebook = F.normalize(codebook, dim=-1)
+        self.register_buffer("codebook", codebook)
+        self.register_buffer("codebook_sq", (codebook ** 2).sum(-1))
+
+    def forward(self, mel: torch.Tensor) -> torch.Tensor:
+        model = self.model
+        x = model.downsample_embeddings(self.encoder(mel).float())
+        x = x + model.mlp(model.mlp_ln(x))
+        x = model.rq.project_in(x)
+        x = model.rq.layers[0].project_in(x)
+        if self.cosine:
+            scores = F.normalize(x, dim=-1) @ self.codebook.t()
+        else:
+            # Negative squared distance without the per-row constant
+            scores = 2 * x @ self.codebook.t() - self.codebook_sq
+        return scores.argmax(-1)
+
+
+def export_onnx(model, path: str, opset: int = 17):
+    """
+    Export an fp32 CPU tokenizer (after `setup`) to an ONNX graph taking a
+    [batch, n_mels, 3000] padded mel and returning [batch, tokens] int64 ids
+    """
+    if model.precision != "fp32":
+        raise ValueError(f"Only fp32 models can be exported, got {model.precision}")
+    graph = TokenizerGraph(model).cpu().eval()
+    n_mels = graph.encoder.dims.n_mels
+    mel = torch.full((1, n_mels, whisper.audio.N_FRAMES), -1.5)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            graph,
+            (mel,),
+            path,
+            input_names=["mel"],
+            output_names=["stoks"],
+            dynamic_axes={"mel": {0: "batch"}, "stoks": {0: "batch"}},
+            opset_version=opset,
+        )
+
+
+class OnnxEncoderRunner:
+    """
+    Runs an exported tokenizer graph with ONNX Runtime. Attached to an
+    `IchigoTokenizer` with `use_graph`, it replaces the PyTorch encoder and
+    quantizer while the front-end and windowing stay unchanged.
+    """
+
+    def __init__(self, path: str, device: str = "cpu", num_threads: int = None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = num_threads or torch.get_num_threads()
+        providers = ["CPUExecutionProvider"]
+        if device.startswith("cuda") and "CUDAExecutionProvider" in ort.get_available_providers():
+            providers.insert(0, ("CUDAExecutionProvider", {"device_id": torch.device(device).index or 0}))
+        self.session = ort.InferenceSession(path, options, providers=providers)
+
+        mel = self.session.get_inputs()[0]
+        self.n_mels, self.n_ctx = mel.shape[1], mel.shape[2]
+
+    def __call__(self, padded: torch.Tensor) -> torch.Tensor:
+        (stoks,) = self.session.run(None, {"mel": padded.float().cpu().numpy()})
+        return torch.from_numpy(stoks).to(padded.device)
@@ -0,0 +1,33 @@
+"""
+Build a prepared artifact directory for fast whisper service start-up.
+
+The directory holds safetensors files with just the quantizer (`rq`, `mlp`,
+`mlp_ln`) and Whisper encoder weights. Point WHISPER_PREPARED_DIR at it to
+load them with mmap instead of reading and filtering the full checkpoints.
+Weights are written as fp32 whatever the source checkpoint's dtype; the
+encoder adopts the stored tensors as-is, so artifacts must stay fp32.
+
+Usage: python prepare.py --out /models/ichigo-prepared
+"""
+import argparse
+import time
+
+from utils import ICHIGO_NAME, MODEL_SIZE, load_model, save_prepared_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ref", default=ICHIGO_NAME)
+    parser.add_argument("--size", default=MODEL_SIZE)
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ichigo_model = load_model(ref=args.ref, size=args.size)
+    ichigo_model.setup(device="cpu")
+    save_prepared_model(ichigo_model, args.out)
+    print(f"Wrote prepared artifacts to {args.out} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Multi-worker launcher for the whisper tokenizer service.
+
+The parent binds the listening socket once and spawns WHISPER_WORKERS
+uvicorn workers that accept on it. Each worker gets a slot index
+(WHISPER_WORKER_INDEX) that app.py maps onto WHISPER_DEVICES, so GPUs can be
+assigned per worker, and CPU-only hosts split their cores between workers.
+Weights are memory-mapped (WHISPER_PREPARED_DIR or the cached checkpoints),
+so workers share one page-cache copy instead of each holding its own.
+
+Usage: WHISPER_WORKERS=4 WHISPER_DEVICES=cpu python serve.py
+"""
+import logging
+import multiprocessing as mp
+import os
+import signal
+import time
+
+import uvicorn
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+host = os.getenv("WHISPER_HOST", "0.0.0.0")
+port = int(os.getenv("WHISPER_PORT", "3348"))
+workers = int(os.getenv("WHISPER_WORKERS", "1"))
+# Intra-op threads per worker; defaults to an even split of the host's cores
+threads_per_worker = int(
+    os.getenv("WHISPER_THREADS_PER_WORKER", str(max(1, (os.cpu_count() or 1) // workers))))
+
+
+def run_worker(index: int, sockets: list):
+    # Must be set before app.py (and torch) is imported in this process
+    os.environ["WHISPER_WORKER_INDEX"] = str(index)
+    os.environ["OMP_NUM_THREADS"] = str(threads_per_worker)
+    os.environ["MKL_NUM_THREADS"] = str(threads_per_worker)
+
+    config = uvicorn.Config("app:app", host=host, port=port, log_level="info")
+    uvicorn.Server(config).run(sockets=sockets)
+
+
+def main():
+    if workers <= 1:
+        run_worker(0, sockets=None)
+        return
+
+    sock = uvicorn.Config("app:app", host=host, port=port).bind_socket()
+    ctx = mp.get_context("spawn")
+
+    def spawn(index: int):
+        proc = ctx.Process(target=run_worker, args=(index, [sock]), name=f"whisper-worker-{index}")
+        proc.start()
+        logger.info(f"Started worker {index} (pid {proc.pid}, {threads_per_worker} threads)")
+        return proc
+
+    procs = [spawn(i) for i in range(workers)]
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    # Restart workers that die, keeping their slot (and so their device)
+    while not stopping:
+        for index, proc in enumerate(procs):
+            if not proc.is_alive() and not stopping:
+                logger.warning(f"Worker {index} exited with {proc.exitcode}, restarting")
+                procs[index] = spawn(index)
+        time.sleep(1)
+
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        proc.join()
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+from typing import List
+
+
+class PcmRingBuffer:
+    """
+    Fixed-size buffer that accumulates s16le PCM bytes into windows.
+
+    A single window-sized buffer is allocated up front and reused; each
+    completed window is returned as bytes and the write position wraps back
+    to the start.
+    """
+
+    def __init__(self, window_samples: int):
+        if window_samples < 1:
+            raise ValueError(f"window_samples must be positive, got {window_samples}")
+        self.window_bytes = window_samples * 2
+        self._buffer = bytearray(self.window_bytes)
+        self._fill = 0
+
+    def write(self, data: bytes) -> List[bytes]:
+        """Append PCM bytes; returns the windows completed by this write"""
+        windows = []
+        view = memoryview(data)
+        while view:
+            n = min(len(view), self.window_bytes - self._fill)
+            self._buffer[self._fill: self._fill + n] = view[:n]
+            self._fill += n
+            view = view[n:]
+            if self._fill == self.window_bytes:
+                windows.append(bytes(self._buffer))
+                self._fill = 0
+        return windows
+
+    def flush(self) -> bytes:
+        """Return the partial window (whole samples only) and reset"""
+        data = bytes(self._buffer[: self._fill - self._fill % 2])
+        self._fill = 0
+        return data
+
+    @property
+    def buffered_samples(self) -> int:
+        return self._fill // 2
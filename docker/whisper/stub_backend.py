@@ -0,0 +1,50 @@
+"""
+Weight-free stand-in for the tokenizer, for load tests on CPU.
+
+Select it with WHISPER_BACKEND=stub. Tokens are meaningless, but requests take
+the real path through decoding, the batched front-end, windowing and
+stitching, so queueing and per-stage timings stay representative.
+"""
+from types import SimpleNamespace
+
+import torch
+import torch.nn.functional as F
+
+from components import IchigoTokenizer
+
+
+class StubTokenizer:
+    """
+    Same batch interface as `IchigoTokenizer`, with the encoder and quantizer
+    replaced by pooling and a fixed random projection onto the codebook.
+    """
+
+    downsample = 2
+    precision = "fp32"
+    graph_runner = None
+    config = SimpleNamespace(mask_embs=True)
+
+    # Padding, windowing and stitching are shared with the real tokenizer
+    _pad_mel = IchigoTokenizer._pad_mel
+    _context_frames = IchigoTokenizer._context_frames
+    _n_tokens = IchigoTokenizer._n_tokens
+    _encode_batched = IchigoTokenizer._encode_batched
+    _split_windows = IchigoTokenizer._split_windows
+    quantize_batch = IchigoTokenizer.quantize_batch
+
+    def __init__(self, n_mels: int = 80, codebook_size: int = 2560, device: str = "cpu", seed: int = 0):
+        generator = torch.Generator().manual_seed(seed)
+        self.projection = torch.randn(n_mels, codebook_size, generator=generator)
+        self.to(device)
+
+    def to(self, device):
+        self.device = device
+        self.projection = self.projection.to(device)
+        return self
+
+    def _n_mels(self):
+        return self.projection.shape[0]
+
+    def _encode_padded(self, padded):
+        pooled = F.avg_pool1d(padded, 2 * self.downsample)
+        return (pooled.transpose(1, 2) @ self.projection).argmax(-1)
@@ -0,0 +1,92 @@
+import io
+import struct
+import wave
+
+import pytest
+import torch
+
+from audio import AudioFormat, parse_wav_s16, sniff_format
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, no padding: 417-byte frames
+MP3_HEADER = bytes([0xFF, 0xFB, 0x90, 0x00])
+MP3_FRAME_LENGTH = 417
+
+
+def mp3_frames(count: int) -> bytes:
+    return (MP3_HEADER + bytes(MP3_FRAME_LENGTH - 4)) * count
+
+
+def adts_frames(count: int, length: int = 100) -> bytes:
+    # MPEG-4 AAC LC, 44.1 kHz, stereo, no CRC
+    header = bytes([
+        0xFF, 0xF1, 0x50, 0x80 | (length >> 11) & 0x03,
+        (length >> 3) & 0xFF, ((length & 0x07) << 5) | 0x1F, 0xFC,
+    ])
+    return (header + bytes(length - 7)) * count
+
+
+def make_wav(samples, channels: int = 1, sample_rate: int = 16000, width: int = 2) -> bytes:
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(width)
+        f.setframerate(sample_rate)
+        f.writeframes(struct.pack(f"<{len(samples)}h", *samples) if width == 2 else bytes(samples))
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("data, expected", [
+    (make_wav([0, 1, 2]), AudioFormat.WAV),
+    (b"fLaC" + bytes(40), AudioFormat.FLAC),
+    (b"OggS" + bytes(24) + b"OpusHead" + bytes(20), AudioFormat.OPUS),
+    (b"OggS" + bytes(24) + b"\x01vorbis" + bytes(20), AudioFormat.OGG),
+    (b"ID3" + bytes(40), AudioFormat.MP3),
+    (mp3_frames(4), AudioFormat.MP3),
+    (mp3_frames(1), AudioFormat.MP3),
+    (adts_frames(4), AudioFormat.AAC),
+    (bytes(3200), AudioFormat.PCM),
+])
+def test_sniff_format(data, expected):
+    assert sniff_format(data) == expected
+
+
+@pytest.mark.parametrize("sample", [-1, -2, -256, -7937])
+def test_sniff_format_negative_pcm(sample):
+    # Little-endian negative samples start with the FF Ex frame sync
+    assert sniff_format(struct.pack("<h", sample) * 8000) == AudioFormat.PCM
+
+
+def test_sniff_format_requires_matching_second_frame():
+    # Valid first header, then a second frame of another sample rate
+    other_rate = bytes([0xFF, 0xFB, 0x94, 0x00]) + bytes(MP3_FRAME_LENGTH - 4)
+    assert sniff_format(mp3_frames(1) + other_rate) == AudioFormat.PCM
+    assert sniff_format(mp3_frames(1) + bytes(1000)) == AudioFormat.PCM
+
+
+def test_parse_wav_s16_mono():
+    wav, sample_rate = parse_wav_s16(make_wav([0, 16384, -32768], sample_rate=22050))
+    assert sample_rate == 22050
+    assert torch.equal(wav, torch.tensor([[0.0, 0.5, -1.0]]))
+
+
+def test_parse_wav_s16_stereo():
+    wav, _ = parse_wav_s16(make_wav([1, -1, 2, -2], channels=2))
+    assert torch.equal(wav * 32768, torch.tensor([[1.0, 2.0], [-1.0, -2.0]]))
+
+
+def test_parse_wav_s16_unset_data_size():
+    data = bytearray(make_wav([1, 2, 3, 4]))
+    data_offset = data.index(b"data") + 4
+    data[data_offset:data_offset + 4] = struct.pack("<I", 0xFFFFFFFF)
+    wav, _ = parse_wav_s16(bytes(data))
+    assert wav.shape == (1, 4)
+
+
+def test_parse_wav_s16_empty():
+    wav, _ = parse_wav_s16(make_wav([]))
+    assert wav.shape == (1, 0)
+
+
+def test_parse_wav_s16_rejects_other_encodings():
+    assert parse_wav_s16(make_wav([0, 128, 255], width=1)) is None
+    assert parse_wav_s16(b"RIFF\x04\x00\x00\x00WAVE") is None
@@ -1,45 +1,137 @@
 from ichigo_whisper.config.vq_config import VQConfig
-from components import IchigoTokenizer
+from audio import AudioFormat
+from components import IchigoTokenizer, _load_checkpoint
+import dataclasses
+import json
 import os
+import re
+import time
+from typing import List, Tuple
+import numpy as np
 import torch
 from huggingface_hub import hf_hub_download
 
-def convert_ids_to_tokens(id_list):
+SOUND_START = "<|sound_start|>"
+SOUND_END = "<|sound_end|>"
+
+# Lookup tables for the formatted token strings; an empty duration means a
+# single occurrence, which is written without a duration token
+_SOUND_TOKENS = np.array([f"<|sound_{i:04d}|>" for i in range(10000)], dtype=object)
+_DURATION_TOKENS = np.array(
+    ["", ""] + [f"<|duration_{i:02d}|>" for i in range(2, 1501)], dtype=object)
+_TOKEN_PATTERN = re.compile(r"(?:<\|duration_(\d+)\|>)?<\|sound_(\d+)\|>")
+
+
+def _as_array(ids) -> np.ndarray:
+    if isinstance(ids, torch.Tensor):
+        ids = ids.detach().cpu().numpy()
+    return np.asarray(ids, dtype=np.int64).reshape(-1)
+
+
+def _lookup(table: np.ndarray, indices: np.ndarray, fmt: str) -> np.ndarray:
+    """Index a token table, formatting the rare values it does not cover"""
+    out = table[np.minimum(indices, len(table) - 1)]
+    for i in np.flatnonzero(indices >= len(table)):
+        out[i] = fmt.format(int(indices[i]))
+    return out
+
+
+def run_length_encode(ids) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Collapse consecutive repeated IDs.
+
+    Args:
+        ids: 1-D tensor, array or list of sound IDs
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Run values and run lengths
+    """
+    ids = _as_array(ids)
+    if ids.size == 0:
+        return ids, ids
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(ids)) + 1))
+    counts = np.diff(np.append(starts, ids.size))
+    return ids[starts], counts
+
+
+def convert_ids_to_tokens(id_list, with_markers: bool = True):
     """
     Convert a list of IDs to a compressed sound token string.
     
     Args:
-        id_list (list): List of sound IDs
+        id_list (list | np.ndarray | torch.Tensor): 1-D sequence of sound IDs
+        with_markers (bool): Wrap in <|sound_start|> ... <|sound_end|>
     
     Returns:
         str: Formatted string with sound tokens and duration
     """
-    if not id_list:
-        return "<|sound_start|><|sound_end|>"
-    
-    result = ["<|sound_start|>"]
-    i = 0
-    
-    while i < len(id_list):
-        current_id = id_list[i]
-        count = 1
-        
-        # Count consecutive occurrences of the same ID
-        while i + count < len(id_list) and id_list[i + count] == current_id:
-            count += 1
-            
-        # Add duration token if count > 1
-        if count > 1:
-            result.append(f"<|duration_{str(count).zfill(2)}|>")
-            
-        # Add the sound token (each ID separately)
-        result.append(f"<|sound_{str(current_id).zfill(4)}|>")
-        
-        # Move index forward
-        i += count
-    
-    result.append("<|sound_end|>")
-    return "".join(result)
+    start, end = (SOUND_START, SOUND_END) if with_markers else ("", "")
+    values, counts = run_length_encode(id_list)
+    if values.size == 0:
+        return start + end
+
+    # Interleave "<|duration_XX|>" (empty for single runs) with "<|sound_XXXX|>"
+    parts = np.empty(2 * values.size, dtype=object)
+    parts[0::2] = _lookup(_DURATION_TOKENS, counts, "<|duration_{:02d}|>")
+    parts[1::2] = _lookup(_SOUND_TOKENS, values, "<|sound_{:04d}|>")
+    return start + "".join(parts) + end
+
+
+def convert_batch_ids_to_tokens(batch) -> List[str]:
+    """
+    Convert a batch of ID sequences to sound token strings.
+
+    Args:
+        batch: 2-D tensor/array, or a list of 1-D sequences of varying length
+
+    Returns:
+        List[str]: One token string per sequence
+    """
+    return [convert_ids_to_tokens(ids) for ids in batch]
+
+
+def convert_tokens_to_ids(tokens: str) -> np.ndarray:
+    """
+    Inverse of `convert_ids_to_tokens`: expand a sound token string to IDs.
+
+    Args:
+        tokens (str): String of sound and duration tokens
+
+    Returns:
+        np.ndarray: 1-D array of sound IDs
+    """
+    matches = _TOKEN_PATTERN.findall(tokens)
+    if not matches:
+        return np.zeros(0, dtype=np.int64)
+    durations, values = zip(*matches)
+    counts = np.array([int(d) if d else 1 for d in durations], dtype=np.int64)
+    return np.repeat(np.array(values, dtype=np.int64), counts)
+
+# Binary response encodings of sound codes, selected with the Accept header
+CODES_MEDIA_TYPE = "application/octet-stream"
+RLE_MEDIA_TYPE = "application/x-ichigo-rle"
+
+
+def encode_codes(id_list) -> bytes:
+    """Sound IDs as little-endian uint16"""
+    return _as_array(id_list).astype("<u2").tobytes()
+
+
+def decode_codes(data: bytes) -> np.ndarray:
+    """Inverse of `encode_codes`"""
+    return np.frombuffer(data, dtype="<u2").astype(np.int64)
+
+
+def encode_codes_rle(id_list) -> bytes:
+    """Sound IDs as little-endian uint16 (id, run length) pairs"""
+    values, counts = run_length_encode(id_list)
+    return np.stack([values, counts], axis=-1).astype("<u2").tobytes()
+
+
+def decode_codes_rle(data: bytes) -> np.ndarray:
+    """Inverse of `encode_codes_rle`"""
+    pairs = np.frombuffer(data, dtype="<u2").reshape(-1, 2).astype(np.int64)
+    return np.repeat(pairs[:, 0], pairs[:, 1])
 
 def make_ichigo_tokenizer(
     size: str,
@@ -116,6 +208,23 @@ def make_ichigo_tokenizer(
 
     raise ValueError(f"Unknown model size: {size}")
 
+# State dict prefixes of the quantizer part that the tokenizer needs
+REQUIRED_COMPONENTS = ("rq", "mlp", "mlp_ln", "_codebook_usage")
+
+# File names inside a prepared artifact directory (see prepare.py)
+PREPARED_VQ_FILE = "vq.safetensors"
+PREPARED_ENCODER_FILE = "encoder.safetensors"
+
+# Default checkpoint ("repo_id:filename") and size for the service and scripts
+ICHIGO_NAME = "homebrewltd/Ichigo-whisper-v0.1:merge-medium-vi-2d-2560c-dim64.pth"
+MODEL_SIZE = "merge-medium-vi-2d-2560c-dim64"
+
+# Bundled clips used by the benchmark and export scripts
+SAMPLES = {
+    "samples/ref.mp3": AudioFormat.MP3,
+    "samples/sample-3.opus": AudioFormat.OPUS,
+}
+
 # A modified loading method that load only the quantize part of CustomRQBottleneckTransformer.
 def load_model(
     ref,
@@ -151,16 +260,13 @@ def load_model(
         )
 
     # Load and validate spec
-    spec = torch.load(local_filename)
+    spec = _load_checkpoint(local_filename, in_memory=False)
     model_state_dict = {
         k.replace("model.", ""): v for k, v in spec["state_dict"].items()
     }
-    required_components = {
-        'rq', 'mlp', 'mlp_ln', "_codebook_usage"
-    }
     filtered_state_dict = {
         k: v for k, v in model_state_dict.items()
-        if any(k.startswith(comp) for comp in required_components)
+        if k.startswith(REQUIRED_COMPONENTS)
     }
     vq_config = VQConfig()
     ichigo_model = make_ichigo_tokenizer(size=size, config=vq_config)
@@ -168,10 +274,83 @@ def load_model(
     ichigo_model.eval()
     return ichigo_model
 
+def _fp32_cpu(tensor: torch.Tensor) -> torch.Tensor:
+    tensor = tensor.detach().cpu()
+    if tensor.is_floating_point():
+        tensor = tensor.float()
+    return tensor.contiguous()
+
+
+def save_prepared_model(ichigo_model, out_dir: str):
+    """Write the quantizer and encoder weights of a set-up model as safetensors.
+
+    Only the `rq`/`mlp`/`mlp_ln` quantizer weights and the Whisper encoder are
+    kept, so loading skips the full checkpoint and the prefix filtering.
+    Floating weights are stored as fp32: the encoder is loaded with
+    `assign=True` and keeps the stored dtype, and the service applies its
+    own precision (WHISPER_PRECISION) after loading.
+
+    Args:
+        ichigo_model (IchigoTokenizer): Model returned by `load_model` after `setup`
+        out_dir (str): Output directory
+    """
+    from safetensors.torch import save_file
+
+    os.makedirs(out_dir, exist_ok=True)
+    vq_state_dict = {
+        k: _fp32_cpu(v).clone()
+        for k, v in ichigo_model.state_dict().items()
+        if k.startswith(REQUIRED_COMPONENTS)
+    }
+    save_file(vq_state_dict, os.path.join(out_dir, PREPARED_VQ_FILE))
+
+    encoder = ichigo_model.whmodel[0]
+    encoder_state_dict = {
+        k: _fp32_cpu(v)
+        for k, v in encoder.encoder.state_dict().items()
+    }
+    encoder_path = os.path.join(out_dir, PREPARED_ENCODER_FILE)
+    save_file(encoder_state_dict, encoder_path)
+    with open(os.path.splitext(encoder_path)[0] + ".json", "w") as f:
+        json.dump(dataclasses.asdict(encoder.dims), f)
+
+
+def load_prepared_model(prepared_dir: str, size: str, device: str = "cpu"):
+    """Load the quantizer part of a model from a prepared artifact directory.
+
+    Args:
+        prepared_dir (str): Directory written by `save_prepared_model`
+        size (str): Model size, as for `load_model`
+        device (str): Device the weights are loaded onto
+
+    Returns:
+        IchigoTokenizer: Model instance; call `setup(device, encoder_path=...)`
+        with `os.path.join(prepared_dir, PREPARED_ENCODER_FILE)` to load the encoder
+    """
+    from safetensors.torch import load_file
+
+    state_dict = load_file(os.path.join(prepared_dir, PREPARED_VQ_FILE), device=str(device))
+    ichigo_model = make_ichigo_tokenizer(size=size, config=VQConfig())
+    ichigo_model.load_state_dict(state_dict, strict=False)
+    ichigo_model.eval()
+    return ichigo_model
+
+
+def timed(fn, iterations: int, device: str = "cpu") -> float:
+    """Mean milliseconds per call of `fn`, after one warm-up call"""
+    fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / iterations * 1000
+
+
 if __name__ == "__main__":
-    ichigo_name = "homebrewltd/Ichigo-whisper-v0.1:merge-medium-vi-2d-2560c-dim64.pth"
-    model_size = "merge-medium-vi-2d-2560c-dim64"
     device = "cuda" if torch.cuda.is_available() else "cpu"
-    ichigo_model = load_model(ref=ichigo_name, size=model_size)
+    ichigo_model = load_model(ref=ICHIGO_NAME, size=MODEL_SIZE)
     ichigo_model.setup(device=device)
     ichigo_model.to(device)
\ No newline at end of file